@@ -8,14 +8,26 @@ for each sample and generating plots of the absorbance data.
 """
 
 # ----- Importing libraries -------------------------------------------------------------------------
+# pandas, scipy, matplotlib and plotly take seconds to import, so they are imported inside the
+# functions that use them. A run without plots (--no-plots) never loads matplotlib or plotly.
 
-import pandas as pd
+import io
 import os
-import matplotlib.pyplot as plt
+import re
+import sys
+import csv
+import glob
+import json
+import time
+import shutil
+import hashlib
+import tempfile
+import zipfile
+import argparse
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 import numpy as np
-from scipy.signal import find_peaks
-from scipy.optimize import curve_fit
-import plotly.graph_objects as go
 
 # ----- Global variables -------------------------------------------------------------------------
 
@@ -29,18 +41,541 @@ num_samples = 0
 def inverse_exponential(x, a, b, y0):
                 return -a * np.exp(-b * x) + y0
 
+# ----- Fitting functions -------------------------------------------------------------------------
+
+def inverse_exponential_jacobian(x, a, b, y0):
+    # Derivatives of -a*exp(-b*x)+y0 with respect to (a, b, y0), one column each
+    e = np.exp(-b * x)
+    return np.stack(np.broadcast_arrays(-e, a * x * e, np.ones_like(e)), axis=-1)
+
+def simple_guess_inverse_exponential(times, absorbances) -> np.ndarray:
+    # The guesses of the original single-sample fit, for every row:
+    # y0 is the minimum value, a the spread and b the initial slope scaled by a
+    x = np.asarray(times, dtype=float)
+    y = np.atleast_2d(np.asarray(absorbances, dtype=float))
+    y0_guess = y.min(axis=1)
+    a_guess = y.max(axis=1) - y0_guess
+    initial_slope = (y[:, 1] - y[:, 0]) / (x[1] - x[0])
+    with np.errstate(divide='ignore', invalid='ignore'):
+        b_guess = np.where(a_guess != 0, np.abs(initial_slope / a_guess), 0.1)
+    return np.column_stack([a_guess, b_guess, y0_guess])
+
+def seed_inverse_exponential(times, absorbances) -> np.ndarray:
+    """
+    Closed-form estimate of (a, b, y0) for every row of a (samples, timepoints) matrix.
+
+    The model y = -a*exp(-b*x) + y0 satisfies y' = b*(y0 - y), so integrating from the first
+    point gives y - y(x0) = b*y0*(x - x0) - b*S(x), with S the running integral of y. Fitting
+    this by linear least squares gives b; with b fixed, a and y0 follow from a second linear
+    fit (the integral equation method of Jacquelin). Rows where this gives no decaying curve
+    fall back to the simple guesses of the original single-sample fit.
+    """
+    x = np.asarray(times, dtype=float)
+    y = np.atleast_2d(np.asarray(absorbances, dtype=float))
+
+    with np.errstate(all='ignore'):
+        # Running trapezoid integral S and the linear fit of y - y(x0) against (x - x0, S)
+        dx = x - x[0]
+        integral = np.concatenate([np.zeros((len(y), 1)), np.cumsum((y[:, 1:] + y[:, :-1]) / 2 * np.diff(x), axis=1)], axis=1)
+        dy = y - y[:, :1]
+        sxx, sxs, sss = np.sum(dx * dx), integral @ dx, np.sum(integral * integral, axis=1)
+        sxy, ssy = dy @ dx, np.sum(integral * dy, axis=1)
+        b = -(sxx * ssy - sxs * sxy) / (sxx * sss - sxs * sxs)
+
+        # With b known the model is linear in (a, y0): y = y0 + a * (-exp(-b*x))
+        e = -np.exp(-b[:, None] * x)
+        n, se, see = len(x), e.sum(axis=1), np.sum(e * e, axis=1)
+        sy, sey = y.sum(axis=1), np.sum(e * y, axis=1)
+        det = n * see - se * se
+        a = (n * sey - se * sy) / det
+        y0 = (sy - a * se) / n
+
+    seed = np.column_stack([a, b, y0])
+    valid = np.all(np.isfinite(seed), axis=1) & (b > 0)
+    return np.where(valid[:, None], seed, simple_guess_inverse_exponential(x, y))
+
+def fit_inverse_exponential_batch(times, absorbances, max_iter=50, ftol=1e-12, xtol=1e-10, maxfev=20000,
+                                  return_info=False):
+    """
+    Fit -a*exp(-b*x)+y0 to every row of a (samples, timepoints) matrix at once.
+
+    Levenberg-Marquardt steps are taken for all samples together using the analytic Jacobian
+    and batched 3x3 normal equations, each sample keeping its own damping factor. The fits
+    start from the closed-form estimate of seed_inverse_exponential, so most converge within
+    a few steps. Samples that do not converge within max_iter steps are fitted again from the
+    simple guesses of the original single-sample fit, and the ones that still do not converge
+    are refit one at a time with curve_fit (also given the analytic Jacobian), as before; the
+    lowest cost found is kept. The fits stop at a tighter tolerance than curve_fit, so rates
+    agree with the per-sample curve_fit results to a relative tolerance of 1e-4 and R² values
+    to 1e-9. Flat curves (e.g. negative controls) leave b poorly determined and can differ by
+    up to 1e-3.
+
+    Returns an array of shape (samples, 3) holding (a, b, y0) for each sample. With return_info,
+    also returns a dict of per-sample arrays: 'method' ('seeded', 'guess' or 'curve_fit' for
+    the fit that was kept, 'failed' when curve_fit gave up too), 'iterations' (Levenberg-Marquardt
+    steps, plus function evaluations for curve_fit) and 'time_s' (the time of the curve_fit
+    fallback, NaN for samples fitted in the batch), plus 'batch_time_s', the time of the batch.
+    """
+    x = np.asarray(times, dtype=float)
+    y = np.atleast_2d(np.asarray(absorbances, dtype=float))
+    num_samples = y.shape[0]
+    start = time.perf_counter()
+
+    def residuals(p, rows):
+        return y[rows] - inverse_exponential(x, p[:, 0:1], p[:, 1:2], p[:, 2:3])
+
+    def levenberg_marquardt(params, rows):
+        # Fit the given rows from the given starting parameters, returning the parameters, their
+        # cost, whether they converged and the number of steps taken
+        params = params.copy()
+        cost = np.sum(residuals(params, rows) ** 2, axis=1)
+        damping = np.full(len(rows), 1e-3)
+        active = np.isfinite(cost)
+        converged = np.zeros(len(rows), dtype=bool)
+        iterations = np.zeros(len(rows), dtype=int)
+
+        for _ in range(max_iter):
+            if not active.any():
+                break
+            idx = np.flatnonzero(active)
+            iterations[idx] += 1
+            p = params[idx]
+            r = residuals(p, rows[idx])
+
+            # Jacobian of the model with respect to (a, b, y0), shape (samples, timepoints, 3)
+            jac = inverse_exponential_jacobian(x, p[:, 0:1], p[:, 1:2], p[:, 2:3])
+            jtj = np.einsum('stj,stk->sjk', jac, jac)
+            jtr = np.einsum('stj,st->sj', jac, r)
+
+            # Marquardt scaling of the diagonal; samples with a singular system drop out to the fallback
+            lhs = jtj + damping[idx, None, None] * (jtj * np.eye(3))
+            solvable = np.abs(np.linalg.det(lhs)) > 0
+            step = np.zeros_like(p)
+            step[solvable] = np.linalg.solve(lhs[solvable], jtr[solvable][..., None])[..., 0]
+
+            trial = p + step
+            trial_cost = np.sum(residuals(trial, rows[idx]) ** 2, axis=1)
+
+            improved = solvable & (trial_cost < cost[idx])
+            accepted = idx[improved]
+            rejected = idx[~improved & solvable]
+
+            # Converged once an accepted step barely changes the cost, or once the steps become
+            # negligible relative to the parameters (rounding then stops any further improvement)
+            decrease = cost[accepted] - trial_cost[improved]
+            done = decrease <= ftol * np.maximum(cost[accepted], np.finfo(float).tiny)
+            tiny_step = np.all(np.abs(step) <= xtol * (np.abs(p) + xtol), axis=1)
+            done |= tiny_step[improved]
+            stalled = rejected[tiny_step[~improved & solvable] | (damping[rejected] > 1e16)]
+
+            params[accepted] = trial[improved]
+            cost[accepted] = trial_cost[improved]
+            damping[accepted] = np.maximum(damping[accepted] / 10, 1e-12)
+            damping[rejected] *= 10
+
+            converged[accepted[done]] = True
+            converged[stalled] = True
+            active[accepted[done]] = False
+            active[stalled] = False
+            active[idx[~solvable]] = False
+
+        converged &= np.all(np.isfinite(params), axis=1)
+        return params, np.where(np.isfinite(cost), cost, np.inf), converged, iterations
+
+    # Noisy or flat curves can send exp() out of range on the way; those steps are rejected
+    with np.errstate(over='ignore', invalid='ignore'):
+        # Start from the closed-form estimate
+        rows = np.arange(num_samples)
+        params, cost, converged, iterations = levenberg_marquardt(seed_inverse_exponential(x, y), rows)
+        method = np.full(num_samples, 'seeded', dtype=object)
+
+        # Start again from the simple guesses where that did not converge
+        initial_params = simple_guess_inverse_exponential(x, y)
+        retry = np.flatnonzero(~converged)
+        if len(retry):
+            retry_params, retry_cost, retry_converged, retry_iterations = levenberg_marquardt(initial_params[retry], retry)
+            iterations[retry] += retry_iterations
+            better = retry_converged & (retry_cost < cost[retry])
+            params[retry[better]] = retry_params[better]
+            cost[retry[better]] = retry_cost[better]
+            method[retry[better]] = 'guess'
+            converged[retry] = retry_converged
+    batch_time = time.perf_counter() - start
+    fit_times = np.full(num_samples, np.nan)
+
+    # Fall back to scipy for samples the batched fitter could not handle
+    for i in np.flatnonzero(~converged):
+        from scipy.optimize import curve_fit
+        fit_start = time.perf_counter()
+        try:
+            fitted, _, info, _, _ = curve_fit(inverse_exponential, x, y[i], p0=initial_params[i],
+                                              jac=lambda x, a, b, y0: inverse_exponential_jacobian(x, a, b, y0),
+                                              maxfev=maxfev, full_output=True)
+            iterations[i] += info['nfev']
+            fitted_cost = np.sum((y[i] - inverse_exponential(x, *fitted)) ** 2)
+            if not fitted_cost > cost[i]:
+                params[i], cost[i], method[i] = fitted, fitted_cost, 'curve_fit'
+        except RuntimeError:
+            # No convergence within maxfev: keep the best estimate instead of stopping the whole run.
+            # The caller knows which sample and wavelength row i is, so it gives the warning
+            iterations[i] += maxfev
+            method[i] = 'failed'
+            if not np.all(np.isfinite(params[i])):
+                params[i] = initial_params[i]
+        fit_times[i] = time.perf_counter() - fit_start
+
+    if return_info:
+        return params, {'method': method, 'iterations': iterations, 'time_s': fit_times, 'batch_time_s': batch_time}
+    return params
+
+# ----- Output writer functions -------------------------------------------------------------------
+# Output files are handed to a pool of background threads, so the computation does not wait for slow
+# (e.g. network) drives. At most WRITE_QUEUE_SIZE files wait to be written; beyond that write_output
+# blocks until one is done. Every file is written under a temporary name and renamed once complete,
+# so an interrupted run never leaves a partly written file behind that looks finished.
+
+WRITE_QUEUE_SIZE = 64
+_write_executor = None
+_write_slots = None
+_pending_writes = []
+
+def start_writer(threads=4) -> None:
+    """Write the output files in threads background threads from now on (0 writes them immediately)."""
+    global _write_executor, _write_slots
+    if threads > 0 and _write_executor is None:
+        _write_executor = ThreadPoolExecutor(max_workers=threads, thread_name_prefix='uvp-writer')
+        _write_slots = threading.BoundedSemaphore(WRITE_QUEUE_SIZE)
+
+def stop_writer() -> list:
+    """Write the files still queued and stop the writer threads, returning the files that failed."""
+    global _write_executor
+    failed = flush_writes()
+    if _write_executor is not None:
+        _write_executor.shutdown()
+        _write_executor = None
+    return failed
+
+def write_file(path, write_function, *args) -> None:
+    # write_function(temp_file, *args) writes the contents, which then replace the file in one step. The
+    # temporary file keeps the extension, which some writers (e.g. Excel) go by
+    base, extension = os.path.splitext(path)
+    temp_file = f'{base}.tmp{extension}'
+    try:
+        write_function(temp_file, *args)
+        os.replace(temp_file, path)
+    finally:
+        if os.path.exists(temp_file):
+            os.remove(temp_file)
+
+def write_output(path, write_function, *args) -> None:
+    """Write a file with write_function(path, *args), in the background if the writer is started."""
+    if _write_executor is None:
+        write_file(path, write_function, *args)
+        return
+    _write_slots.acquire()
+    future = _write_executor.submit(write_file, path, write_function, *args)
+    future.add_done_callback(lambda _: _write_slots.release())
+    _pending_writes.append((path, future))
+
+def flush_writes() -> list:
+    """Wait until every queued file is written, returning (path, error) for each that could not be."""
+    failed = [(path, future.exception()) for path, future in _pending_writes if future.exception()]
+    _pending_writes.clear()
+    return failed
+
+def write_bytes(path, data) -> None:
+    with open(path, 'wb') as f:
+        f.write(data)
+
+def write_text(path, text) -> None:
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(text)
+
+def write_figure(path, figure, **savefig_args) -> None:
+    # Render a matplotlib figure (or pyplot's current one) in memory, leaving only the file write for the writer
+    buffer = io.BytesIO()
+    figure.savefig(buffer, format='png', **savefig_args)
+    write_output(path, write_bytes, buffer.getvalue())
+
+def write_sample_table(f, df, corrections=None) -> None:
+    # The data of one sample, followed by its correction values as an extra row if there are any
+    import pandas as pd
+    df.to_csv(f)
+    if corrections is not None:
+        corr_row = pd.DataFrame([corrections.to_numpy()], index=['corr_values'], columns=df.columns)
+        corr_row.to_csv(f, header=False)
+
+def write_sample_sheet(excel, sheet_name, df, corrections=None) -> None:
+    # The same as write_sample_table, as a sheet of an Excel workbook
+    import pandas as pd
+    df.to_excel(excel, sheet_name=sheet_name)
+    if corrections is not None:
+        corr_row = pd.DataFrame([corrections.to_numpy()], index=['corr_values'], columns=df.columns)
+        corr_row.to_excel(excel, sheet_name=sheet_name, startrow=len(df) + 1, header=False)
+
+def write_sample_csv(path, df, corrections=None) -> None:
+    with open(path, 'w', newline='') as f:
+        write_sample_table(f, df, corrections)
+
+def write_sample_bundle(path, bundle, suffix, samples) -> None:
+    """
+    Write the tables of several samples into one file: a zip archive holding a <sample><suffix> CSV
+    for each, or an Excel workbook with a sheet for each. samples maps each sample name to the
+    arguments of write_sample_table.
+    """
+    if bundle == 'zip':
+        with zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED) as archive:
+            for sample_name, args in samples.items():
+                with archive.open(f'{sample_name}{suffix}', 'w') as member:
+                    with io.TextIOWrapper(member, encoding='utf-8', newline='') as f:
+                        write_sample_table(f, *args)
+        return
+
+    import pandas as pd
+    sheet_names = set()
+    with pd.ExcelWriter(path, engine='openpyxl') as excel:
+        for sample_name, args in samples.items():
+            # Sheet names are at most 31 characters, without []:*?/\ and unique regardless of case
+            sheet_name = ''.join('_' if c in '[]:*?/\\' else c for c in sample_name)[:31]
+            base, n = sheet_name, 1
+            while sheet_name.lower() in sheet_names:
+                n += 1
+                sheet_name = f'{base[:31 - len(str(n)) - 1]}_{n}'
+            sheet_names.add(sheet_name.lower())
+            write_sample_sheet(excel, sheet_name, *args)
+
+def bundle_file(output_root, stage_dir, bundle) -> str:
+    # The file holding the CSVs of every sample of a stage when they are bundled
+    return os.path.join(output_root, stage_dir, f'{stage_dir}.{bundle}')
+
+# ----- Plot rendering functions -------------------------------------------------------------------
+# These run either in the main process or in a worker process, so they only take plain arrays
+# and strings and return the paths of the files they wrote.
+
+def _init_plot_worker():
+    # Worker processes never show figures, so render straight to the non-interactive Agg backend
+    import matplotlib
+    matplotlib.use('Agg')
+
+    # Workers already run alongside the main process, so they write their files themselves
+    global _write_executor
+    _write_executor = None
+
+def run_plot_jobs(render_function, jobs, n_jobs=1):
+    """Run render_function(*job) for every job, in a process pool if n_jobs > 1, yielding results in order."""
+    if n_jobs <= 1 or len(jobs) <= 1:
+        for job in jobs:
+            yield render_function(*job)
+        return
+
+    # Spawn rather than fork: the background writer threads may be holding locks that a forked child
+    # would inherit, and spawn is already what Windows uses
+    context = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(max_workers=min(n_jobs, len(jobs)), mp_context=context,
+                             initializer=_init_plot_worker) as executor:
+        futures = [executor.submit(render_function, *job) for job in jobs]
+        for future in futures:
+            yield future.result()
+
+def write_plotly_bundle(interactive_plot_dir, plotly_js='directory', refresh=True):
+    """Write plotly.js once next to the interactive plots, which then load it instead of embedding it."""
+    bundle_file = os.path.join(interactive_plot_dir, 'plotly.min.js')
+    if plotly_js == 'directory' and (refresh or not os.path.exists(bundle_file)):
+        from plotly.offline import get_plotlyjs
+        write_output(bundle_file, write_text, get_plotlyjs())
+
+# The absorbance plot figure of this process, reused for every sample so that only the data of its
+# artists changes from one plot to the next
+_absorbance_figure = {}
+
+def trace_columns(n_columns, max_traces=0) -> np.ndarray:
+    # Evenly spaced columns (always the first and the last) when there are more than max_traces
+    if not max_traces or n_columns <= max_traces:
+        return np.arange(n_columns)
+    return np.unique(np.linspace(0, n_columns - 1, max_traces).round().astype(int))
+
+def absorbance_figure(style='lines', n_traces=0):
+    """
+    Return (figure, axes, artists) for an absorbance plot, creating them only when the style or the
+    number of traces changes. The artists are a list of lines ('lines'), one LineCollection
+    ('collection') or one image ('heatmap').
+    """
+    import matplotlib.pyplot as plt
+
+    if _absorbance_figure.get('key') != (style, n_traces):
+        close_absorbance_figure()
+        figure = plt.figure(figsize=(10, 6))
+        axes = figure.gca()
+
+        if style == 'lines':
+            artists = [axes.plot([], [])[0] for _ in range(n_traces)]
+        elif style == 'collection':
+            from matplotlib.collections import LineCollection
+            artists = LineCollection([], cmap='viridis')
+            axes.add_collection(artists)
+            figure.colorbar(artists, ax=axes, label='Time (seconds)')
+        else:
+            artists = axes.imshow(np.zeros((1, 1)), aspect='auto', origin='lower', interpolation='nearest', cmap='viridis')
+            figure.colorbar(artists, ax=axes, label='Absorbance')
+
+        if style == 'heatmap':
+            axes.set_xlabel('Time (seconds)')
+            axes.set_ylabel('Wavelength (nm)')
+        else:
+            axes.set_xlabel('Wavelength (nm)')
+            axes.set_ylabel('Absorbance')
+            axes.grid(True)
+        _absorbance_figure.update(key=(style, n_traces), figure=figure, axes=axes, artists=artists)
+
+    return _absorbance_figure['figure'], _absorbance_figure['axes'], _absorbance_figure['artists']
+
+def close_absorbance_figure():
+    if _absorbance_figure:
+        import matplotlib.pyplot as plt
+        plt.close(_absorbance_figure['figure'])
+        _absorbance_figure.clear()
+
+def render_absorbance_plot(sample_name, wavelengths, time_labels, absorbance, plot_dir, interactive_plot_dir, plotly_js='directory',
+                           max_traces=0, style='lines'):
+    """
+    Plot the spectrum of every time point of a sample. Beyond max_traces time points (0 for no limit)
+    only max_traces evenly spaced ones are drawn, so long runs take no more time or memory than short
+    ones. style 'lines' draws a line per time point, 'collection' draws them as one LineCollection
+    coloured by time and 'heatmap' draws all time points as an image of wavelength against time.
+    """
+    import plotly.graph_objects as go
+
+    columns = trace_columns(len(time_labels), max_traces)
+    times = np.array([float(str(label).replace('s', '')) for label in time_labels])
+    figure, axes, artists = absorbance_figure(style, len(columns) if style == 'lines' else 0)
+
+    # Put this sample's data into the reused artists
+    if style == 'lines':
+        # Plot each column (time point) with a different color
+        for line, j in zip(artists, columns):
+            line.set_data(wavelengths, absorbance[:, j])
+        axes.relim()
+        axes.autoscale_view()
+    elif style == 'collection':
+        shown = absorbance[:, columns]
+        artists.set_segments(np.stack([np.broadcast_to(wavelengths, shown.T.shape), shown.T], axis=-1))
+        artists.set_array(times[columns])
+        artists.set_clim(times[0], times[-1])
+        axes.ignore_existing_data_limits = True
+        axes.update_datalim([(np.nanmin(wavelengths), np.nanmin(shown)), (np.nanmax(wavelengths), np.nanmax(shown))])
+        axes.autoscale_view()
+    else:
+        # Rows are drawn from the first wavelength up, whichever way the wavelengths run
+        artists.set_data(absorbance)
+        artists.set_extent((times[0], times[-1], wavelengths[0], wavelengths[-1]))
+        artists.set_clim(np.nanmin(absorbance), np.nanmax(absorbance))
+        axes.set_xlim(times[0], times[-1])
+        axes.set_ylim(min(wavelengths[0], wavelengths[-1]), max(wavelengths[0], wavelengths[-1]))
+    axes.set_title(f'Absorbance vs Wavelength for {sample_name}')
+
+    plotly_fig = go.Figure()
+    if style == 'heatmap':
+        plotly_fig.add_trace(go.Heatmap(x=times[columns], y=wavelengths, z=absorbance[:, columns], colorscale='Viridis',
+                                        colorbar=dict(title='Absorbance')))
+    else:
+        from plotly.colors import sample_colorscale
+        span = max(times[-1] - times[0], 1e-12)
+        colors = sample_colorscale('Viridis', list((times[columns] - times[0]) / span)) if style == 'collection' else None
+        for k, j in enumerate(columns):
+            plotly_fig.add_trace(go.Scatter(x=wavelengths, y=absorbance[:, j], mode='lines', name=time_labels[j],
+                                            line=dict(color=colors[k]) if colors else None))
+
+    plotly_fig.update_layout(title=f'Absorbance vs Wavelength for {sample_name}',
+                             xaxis_title='Time (seconds)' if style == 'heatmap' else 'Wavelength (nm)',
+                             yaxis_title='Wavelength (nm)' if style == 'heatmap' else 'Absorbance',
+                             showlegend = False)
+
+    # Save the plot; the figure stays open for the next sample
+    plot_file = os.path.join(plot_dir, f'{sample_name}_absorbance_plot.png')
+    write_figure(plot_file, figure, dpi=300, bbox_inches='tight')
+
+    html_file = os.path.join(interactive_plot_dir, f'{sample_name}_absorbance_plot.html')
+    write_output(html_file, write_text, plotly_fig.to_html(include_plotlyjs=plotly_js))
+    return plot_file, html_file
+
+def render_rate_plot(sample_name, times, absorbances, x_fit, y_fit, fit_info, max_abs_row, plot_dir, interactive_plot_dir, plotly_js='directory'):
+    import matplotlib.pyplot as plt
+    import plotly.graph_objects as go
+
+    # Create the plot
+    plt.figure(figsize=(10, 6))
+    plotly_fig = go.Figure()
+
+    # Plot scatter points
+    plt.scatter(times, absorbances, color='blue', label='Data points')
+    plotly_fig.add_trace(go.Scatter(x=times, y=absorbances, mode='markers', name='Data points'))
+
+    # Plot best fit line
+    plt.plot(x_fit, y_fit, 'r-', label='Best fit line')
+    plotly_fig.add_trace(go.Scatter(x=x_fit, y=y_fit, mode='lines', name='Best fit line'))
+
+    # Add fit information to plot
+    plt.text(0.02, 0.98, fit_info,
+            transform=plt.gca().transAxes,
+            verticalalignment='top',
+            bbox=dict(boxstyle='round', facecolor='white', alpha=0.8))
+
+    plt.xlabel('Time (seconds)')
+    plt.ylabel('Absorbance')
+    plt.title(f'Absorbance vs Time for {sample_name}\nMax absorbance at {max_abs_row} nm')
+    plt.grid(True)
+
+    plotly_fig.update_layout(title=f'Absorbance vs Time for {sample_name}\nMax absorbance at {max_abs_row} nm',
+                             xaxis_title='Time (seconds)',
+                             yaxis_title='Absorbance',
+                             showlegend = False)
+    plotly_fig.add_annotation(text=fit_info,
+                              xref="paper",
+                              yref="paper",
+                              x=0.02,
+                              y=0.98,
+                              showarrow=False,
+                              font=dict(size=12),
+                              align='left')
+
+    # Save the plot
+    plot_file = os.path.join(plot_dir, f'{sample_name}_rate_plot.png')
+    write_figure(plot_file, plt, dpi=300, bbox_inches='tight')
+    plt.close()
+
+    html_file = os.path.join(interactive_plot_dir, f'{sample_name}_rate_plot.html')
+    write_output(html_file, write_text, plotly_fig.to_html(include_plotlyjs=plotly_js))
+    return plot_file, html_file
+
 # ----- Processing functions -------------------------------------------------------------------------
 
-def process_uv_data(input_file, run_time, interval) -> dict:
-    # Read the CSV file
-    df = pd.read_csv(input_file)
-    
-    # Directory used to store the output files
-    output_dir = 'output/processed_uv_data'
-    
-    # Get all column names
-    all_columns = df.columns
-    
+def count_data_rows(input_file, header_rows=2) -> int:
+    # Count the lines after the header in binary blocks, without parsing them
+    lines = 0
+    last_byte = b'\n'
+    with open(input_file, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            lines += block.count(b'\n')
+            last_byte = block[-1:]
+    if last_byte != b'\n':
+        lines += 1
+    return max(lines - header_rows, 0)
+
+def read_uv_export(input_file, num_samples=0, max_cycles=None, dtype=np.float64, chunk_fields=1 << 20):
+    """
+    Stream an export into a preallocated (samples, wavelengths, cycles) array.
+
+    The two header rows are parsed once, then the data rows are read in chunks of about
+    chunk_fields values and copied straight into the array, so memory use stays close to
+    the size of the result. Returns (sample_names, wavelengths, data).
+    """
+    import pandas as pd
+
+    # Get all column names from the first header row (blank ones named as pandas would)
+    with open(input_file, newline='', encoding='utf-8-sig') as f:
+        header = next(csv.reader(f))
+    all_columns = [col if col else f'Unnamed: {i}' for i, col in enumerate(header)]
+
     # Find unique sample names by looking at non-blank columns until we hit a "_c1" suffix
     # Or by getting the first 'num_samples' column names
     sample_names = []
@@ -53,333 +588,455 @@ def process_uv_data(input_file, run_time, interval) -> dict:
     elif (num_samples >= 1):
         count = 0
         for col in all_columns:
-            if ("Unamed" not in col):
+            if ("Unnamed" not in col) and (col.strip()):
                 if (count >= num_samples):
                     break
                 sample_names.append(col)
+                count += 1
 
-    
     # Calculate number of repeat experiments
     l = len(sample_names)  # number of unique samples
-    N = (len(all_columns) // l) - 1  # number of repeat experiments
-    
-    # Drop the first row of the dataframe as it contains header information
-    df = df.iloc[1:]
-    
-    # Convert all columns to float
-    df = df.astype(float)
-    
+
+    # Every cycle holds a (wavelength, absorbance) column pair per sample, so the absorbance
+    # of sample i in cycle n sits at column (2i+1) + 2ln. Only the wavelength column and these
+    # columns are parsed. A trailing incomplete cycle is dropped.
+    num_cycles = len(all_columns) // (2 * l)
+    if max_cycles is not None:
+        num_cycles = min(num_cycles, max_cycles)
+    usecols = [0] + list(range(1, 2 * l * num_cycles, 2))
+
+    # Preallocate the result; blank lines make this a slight overestimate, trimmed at the end
+    capacity = count_data_rows(input_file)
+    wavelengths = np.empty(capacity)
+    data = np.empty((l, capacity, num_cycles), dtype=dtype)
+
+    # round_trip parsing gives exactly the values Python's float() would
+    chunks = pd.read_csv(input_file, header=None, skiprows=2, usecols=usecols, dtype=float,
+                         float_precision='round_trip', chunksize=max(1, chunk_fields // len(all_columns)))
+    row = 0
+    for chunk in chunks:
+        values = chunk.to_numpy()
+        n = len(values)
+        if row + n > capacity:
+            raise ValueError(f"{input_file} has more data rows than lines")
+        wavelengths[row:row + n] = values[:, 0]
+        data[:, row:row + n, :] = values[:, 1:].reshape(n, num_cycles, l).transpose(2, 0, 1)
+        row += n
+
     # Store wavelengths from the first column
-    wavelengths = df.iloc[:, 0].astype(int)
-    
+    wavelengths = pd.Index(wavelengths[:row].astype(int), name=all_columns[0])
+    return sample_names, wavelengths, data[:, :row, :]
+
+def save_processed_data(sample_dataframes, output_root='output', bundle=None) -> None:
+    # Directory used to store the output files
+    output_dir = os.path.join(output_root, 'processed_uv_data')
+
+    # All samples in one zip archive or Excel workbook
+    if bundle and sample_dataframes:
+        output_file = bundle_file(output_root, 'processed_uv_data', bundle)
+        write_output(output_file, write_sample_bundle, bundle, '_uv_data.csv',
+                     {sample_name: (sample_df,) for sample_name, sample_df in sample_dataframes.items()})
+        print(f'Processed {len(sample_dataframes)} samples - saved to {output_file}')
+        print()
+        return
+
+    for sample_name, sample_df in sample_dataframes.items():
+        output_file = os.path.join(output_dir, f'{sample_name}_uv_data.csv')
+        write_output(output_file, write_sample_csv, sample_df)
+        print(f'Processed {sample_name} - saved to {output_file}')
+    if sample_dataframes:
+        print()
+
+def process_uv_data(input_file, run_time, interval, output_root='output', num_samples=0, dtype=np.float64,
+                    bundle=None, save=True) -> dict:
+    import pandas as pd
+
     # Create time points for column headers
     time_points = [f"{t}s" for t in range(0, int(run_time) + int(interval), int(interval))]
-    
+
+    # Read the CSV file into a (samples, wavelengths, cycles) array, with the cycles capped at the number of time points
+    sample_names, wavelengths, data = read_uv_export(input_file, num_samples, len(time_points), dtype)
+    num_cycles = data.shape[2]
+
     # Dictionary to store all sample dataframes
     sample_dataframes = {}
-    
+
     # Process each sample
     for i, sample_name in enumerate(sample_names):
-        # Find all absorbance columns for this sample using the pattern (2i+1)+ln
-        absorbance_indices = []
-        for n in range(N + 1):  # n goes from 0 to N
-            col_idx = (2 * (i+1) - 1) + 2*(l * n)
-            if col_idx < len(all_columns):
-                absorbance_indices.append(col_idx)
-        
-        
-        if absorbance_indices:
-            # Create a dictionary to store the data
-            data_dict = {}
-            for idx, time_point in zip(absorbance_indices, time_points[:len(absorbance_indices)]):
-                data_dict[time_point] = df.iloc[:, idx].values
-            
-            # Create dataframe with wavelengths as index and absorbance columns
-            sample_df = pd.DataFrame(data_dict, index=wavelengths)
-            
+        if num_cycles:
+            # Create dataframe with wavelengths as index and absorbance columns (no copy of the array)
+            sample_df = pd.DataFrame(data[i], index=wavelengths, columns=time_points[:num_cycles], copy=False)
+
             # Store in dictionary
             sample_dataframes[sample_name] = sample_df
-            
-            # Save to CSV
-            output_file = os.path.join(output_dir, f'{sample_name}_uv_data.csv')
-            sample_df.to_csv(output_file)
-            print(f'Processed {sample_name} - saved to {output_file}')
-    
-    print()
+
+    # Save to CSV
+    if save:
+        save_processed_data(sample_dataframes, output_root, bundle)
+
     # Invert the order of the dictionary
     sample_dataframes = dict(reversed(list(sample_dataframes.items())))
     
     return sample_dataframes
 
-def normalize_data(processed_dataframes) -> dict:
-    # Directory used to store the output files
-    output_dir = 'output/normalised_uv_data'
-    
-    # Dictionary to store the normalised dataframes
-    normalised_dataframes = {}
+def compute_normalisation(processed_dataframes, dtype=None):
+    """
+    Baseline-correct every sample, returning (normalised_dataframes, correction_values) keyed by sample.
 
-    # Process each sample
-    for sample_name, df in processed_dataframes.items():
-        
-        # Calculate the baseline correction values
-        row_ranges = df.max(axis=1) - df.min(axis=1)
-        idx = row_ranges.idxmin()
-        min_range_row = df.loc[idx].copy()
-        smallest_value = min_range_row.min()
-        correction_values = min_range_row - smallest_value
+    The samples are stacked into one (samples, wavelengths, cycles) array, which becomes the storage of the
+    normalised dataframes, and corrected in a single vectorised pass. dtype selects the storage type
+    (e.g. np.float32); by default it is that of the processed data.
+    """
+    import pandas as pd
+
+    sample_names = list(processed_dataframes)
+    if not sample_names:
+        return {}, {}
+    first_df = processed_dataframes[sample_names[0]]
+    if dtype is None:
+        dtype = first_df.to_numpy().dtype
+
+    # Copy the samples into the array that holds the normalised data
+    normalised = np.empty((len(sample_names),) + first_df.shape, dtype=dtype)
+    for i, df in enumerate(processed_dataframes.values()):
+        normalised[i] = df.to_numpy()
 
-        # Subtract correction values from corresponding columns
-        df = df.subtract(correction_values)
+    # The wavelength whose absorbance changes least over time is the baseline of each sample
+    row_ranges = np.nanmax(normalised, axis=2) - np.nanmin(normalised, axis=2)
+    idx = np.nanargmin(row_ranges, axis=1)
+    min_range_rows = normalised[np.arange(len(sample_names)), idx, :]
 
-        # Store the normalised dataframe
-        normalised_dataframes[sample_name] = df
+    # Its offset from its smallest value is the correction for each time point
+    corrections = min_range_rows - np.nanmin(min_range_rows, axis=1, keepdims=True)
 
-        # Create a copy of the dataframe for saving to CSV
-        df_to_save = df.copy()
-        # Add correction values as a new row
-        df_to_save.loc['corr_values'] = correction_values
+    # Subtract correction values from corresponding columns, for all samples at once
+    normalised -= corrections[:, None, :]
+
+    # Dictionaries to store the normalised dataframes and their correction values
+    normalised_dataframes = {}
+    correction_values = {}
+    for i, sample_name in enumerate(sample_names):
+        df = processed_dataframes[sample_name]
+        normalised_dataframes[sample_name] = pd.DataFrame(normalised[i], index=df.index, columns=df.columns, copy=False)
+        correction_values[sample_name] = pd.Series(corrections[i], index=df.columns, name=df.index[idx[i]])
+
+    return normalised_dataframes, correction_values
+
+def save_normalised_data(normalised_dataframes, correction_values, output_root='output', bundle=None) -> None:
+    # Directory used to store the output files
+    output_dir = os.path.join(output_root, 'normalised_uv_data')
 
-        # Save each normalised dataframe with correction values
+    # All samples in one zip archive or Excel workbook
+    if bundle and normalised_dataframes:
+        output_file = bundle_file(output_root, 'normalised_uv_data', bundle)
+        write_output(output_file, write_sample_bundle, bundle, '_normalised.csv',
+                     {sample_name: (df, correction_values[sample_name]) for sample_name, df in normalised_dataframes.items()})
+        print(f'Saved normalized data for {len(normalised_dataframes)} samples to {output_file}')
+        print()
+        return
+
+    for sample_name, df in normalised_dataframes.items():
         output_file = os.path.join(output_dir, f'{sample_name}_normalised.csv')
-        df_to_save.to_csv(output_file)
+
+        # Save each normalised dataframe, followed by its correction values as an extra row
+        write_output(output_file, write_sample_csv, df, correction_values[sample_name])
         print(f'Saved normalized data for {sample_name} to {output_file}')
 
-    print()
+    if normalised_dataframes:
+        print()
+
+def normalize_data(processed_dataframes, output_root='output', dtype=None) -> dict:
+    normalised_dataframes, correction_values = compute_normalisation(processed_dataframes, dtype)
+    save_normalised_data(normalised_dataframes, correction_values, output_root)
     return normalised_dataframes
 
 
-def plot_absorbance_data(dataframes) -> None:
+def plot_absorbance_data(dataframes, jobs=1, plotly_js='directory', output_root='output', plot_samples=None,
+                         max_traces=0, style='lines') -> None:
     # Directory used to store the plots
-    plot_dir = 'output/normalised_plots'
-    interactive_plot_dir = 'output/normalised_plots/interactive_plots'
-    
+    plot_dir = os.path.join(output_root, 'normalised_plots')
+    interactive_plot_dir = os.path.join(plot_dir, 'interactive_plots')
+
+    # Plot every sample, unless only some of them are asked for
+    plot_samples = [name for name in dataframes if plot_samples is None or name in plot_samples]
+
+    # One plot job per sample, holding only the arrays the plot needs
+    plot_jobs = [(sample_name, dataframes[sample_name].index.to_numpy(), list(dataframes[sample_name].columns),
+                  dataframes[sample_name].to_numpy(), plot_dir, interactive_plot_dir, plotly_js, max_traces, style)
+                 for sample_name in plot_samples]
+    write_plotly_bundle(interactive_plot_dir, plotly_js, refresh=bool(plot_jobs))
+
     # Plot each sample
-    for sample_name, df in dataframes.items():
-        plt.figure(figsize=(10, 6))
-        plotly_fig = go.Figure()
-        
-        # Plot each column (time point) with a different color
-        for column in df.columns:
-            plt.plot(df.index, df[column])
-            plotly_fig.add_trace(go.Scatter(x=df.index, y=df[column], mode='lines', name=column))
-        
-        plt.xlabel('Wavelength (nm)')
-        plt.ylabel('Absorbance')
-        plt.title(f'Absorbance vs Wavelength for {sample_name}')
-        plt.grid(True)
-
-        plotly_fig.update_layout(title=f'Absorbance vs Wavelength for {sample_name}',
-                                 xaxis_title='Wavelength (nm)',
-                                 yaxis_title='Absorbance',
-                                 showlegend = False)
-        
-        # Save the plot
-        plot_file = os.path.join(plot_dir, f'{sample_name}_absorbance_plot.png')
-        plt.savefig(plot_file, dpi=300, bbox_inches='tight')
-        plt.close()
+    for sample_name, (plot_file, html_file) in zip(plot_samples, run_plot_jobs(render_absorbance_plot, plot_jobs, jobs)):
         print(f'Saved plot for {sample_name} to {plot_file}')
-
-        plotly_fig.write_html(os.path.join(interactive_plot_dir, f'{sample_name}_absorbance_plot.html'))
-        print(f'Saved interactive plot for {sample_name} to {os.path.join(interactive_plot_dir, f"{sample_name}_absorbance_plot.html")}')
+        print(f'Saved interactive plot for {sample_name} to {html_file}')
+    close_absorbance_figure()
     print()
     return
 
-def determine_rate(dataframes, show_equation=False, fit_type='exponential') -> dict:
-    # Directory used to store the plots
-    plot_dir = 'output/rate_plots'
-    rate_dir = 'output/initial_rates'
-    interactive_plot_dir = 'output/rate_plots/interactive_plots'
-
-    # Getting the max absorbance wavelength from the user
-    print("\nYou can either inspect the plots and give the wavelngth of max absorbance, ")
-    print("or have the program determine it from the very first sample.")
-    print("Enter 0 to have the program determine it")
-    max_abs_row = int(input("Enter the wavelength with the maximum absorbance (e.g., 260): "))
-    print()
+def wavelength_rows(wavelengths) -> dict:
+    # Row of every measured wavelength, built once so a wavelength is found without searching the index
+    return {int(wavelength): row for row, wavelength in enumerate(wavelengths)}
 
-    # Find the wavelength with local maximum absorbance if not user-specified
-    if max_abs_row == 0:
-        # Get the first dataframe from the dictionary
-        first_df = next(iter(dataframes.values()))
-        max_values = first_df.max(axis=1)
+def nearest_wavelength(wavelengths, wavelength) -> int:
+    # The measured wavelength closest to the one asked for, e.g. when the export skips wavelengths
+    wavelengths = np.asarray(wavelengths)
+    return int(wavelengths[np.abs(wavelengths - wavelength).argmin()])
 
-        # Find local maxima in the absorbance values
-        peaks, _ = find_peaks(max_values)
+def peak_wavelength(df) -> int:
+    # Wavelength of the absorbance peak of one sample
+    max_values = df.max(axis=1)
 
-        # If there are multiple peaks, select the second one (local max)
-        if len(peaks) > 1:
-            max_abs_row = max_values.index[peaks[0]]
-        else:
-            # Fallback to the global maximum if no local max is found
-            max_abs_row = max_values.idxmax()
+    # Find local maxima in the absorbance values
+    from scipy.signal import find_peaks
+    peaks, _ = find_peaks(max_values)
+
+    # If there are multiple peaks, select the second one (local max)
+    if len(peaks) > 1:
+        return int(max_values.index[peaks[0]])
+    # Fallback to the global maximum if no local max is found
+    return int(max_values.idxmax())
+
+def resolve_wavelength(dataframes, wavelength=None) -> int:
+    # Getting the max absorbance wavelength from the user, unless it was given
+    if wavelength is None:
+        print("\nYou can either inspect the plots and give the wavelngth of max absorbance, ")
+        print("or have the program determine it from the very first sample.")
+        print("Enter 0 to have the program determine it")
+        wavelength = int(input("Enter the wavelength with the maximum absorbance (e.g., 260): "))
+        print()
+    max_abs_row = wavelength
+    first_df = next(iter(dataframes.values()))
+
+    # Find the wavelength with local maximum absorbance if not user-specified
+    if max_abs_row == 0:
+        max_abs_row = peak_wavelength(first_df)
         
         print(f"\nThe wavelength determined by the programme is:")
         print(f"{max_abs_row} nm")
         print()
+    else:
+        # Use the closest wavelength that was measured
+        nearest = nearest_wavelength(first_df.index, max_abs_row)
+        if nearest != max_abs_row:
+            print(f"{max_abs_row} nm was not measured; using the closest wavelength, {nearest} nm.")
+            max_abs_row = nearest
 
-    # Dictionary to store initial rates
-    initial_rates = {}
-    # order = int(input("Enter your choice (0/1/2): "))
-    
-    # Process each sample
-    for sample_name, df in dataframes.items():
-        # Find the row index for the wavelength
-        row_idx = df.index.get_loc(max_abs_row)
-        # Get the time series data (row of absorbance values)
-        time_series = df.iloc[row_idx]
+    return max_abs_row
 
+def resolve_wavelengths(dataframes, wavelengths=None, per_sample_peak=False) -> list:
+    # One or more wavelengths to determine the rates at. With per_sample_peak, 0 (find the peak)
+    # becomes 'peak': the absorbance peak of each sample instead of that of the first sample
+    if wavelengths is None or np.isscalar(wavelengths):
+        wavelengths = [wavelengths]
 
-        # Convert time points to numeric values (remove 's' and convert to float)
-        times = np.array([float(t.replace('s', '')) for t in time_series.index])
-        absorbances = np.array(time_series.values)
-        
+    resolved = []
+    for wavelength in wavelengths:
+        if wavelength == 'peak' or (per_sample_peak and wavelength == 0):
+            resolved.append('peak')
+        else:
+            resolved.append(resolve_wavelength(dataframes, wavelength))
+
+    # Each wavelength once, in the order given
+    return list(dict.fromkeys(resolved))
+
+def fit_rate_curve(times, absorbances, fit_type='exponential', show_equation=False, exponential_coeffs=None):
+    """
+    Fit one time series and return (initial_rate, y_pred, x_fit, y_fit, equation). The exponential
+    coefficients (a, b, y0) come from fit_inverse_exponential_batch.
+    """
+    x_fit = np.linspace(min(times), max(times), 100)
+    y_pred = None
+    y_fit = None
+    equation = None
+    
+    # Fit curve based on selected type
+    if fit_type == 'polynomial':
+        # Fit a 3rd degree polynomial
+        coeffs = np.polyfit(times, absorbances, 3)
+        poly = np.poly1d(coeffs)
+        y_pred = poly(times)
         
-        x_fit = np.linspace(min(times), max(times), 100)
-        y_pred = None
-        y_fit = None
-        equation = None
+        # Calculate derivative (rate) at t=0
+        derivative = np.polyder(poly)
+        initial_rate = derivative(0)
         
-        # Fit curve based on selected type
-        if fit_type == 'polynomial':
-            # Fit a 3rd degree polynomial
-            coeffs = np.polyfit(times, absorbances, 3)
-            poly = np.poly1d(coeffs)
-            y_pred = poly(times)
-            
-            # Calculate derivative (rate) at t=0
-            derivative = np.polyder(poly)
-            initial_rate = derivative(0)
-            
-            # Generate points for smooth curve
-            y_fit = poly(x_fit)
-            
-            # Create equation string
-            if show_equation:
-                equation = f"y = {coeffs[0]:.2e}x³ + {coeffs[1]:.2e}x² + {coeffs[2]:.2e}x + {coeffs[3]:.2e}"
-            
-        elif fit_type == 'logarithmic':
-            # Fit logarithmic curve: y = a * ln(x) + b
-            # Add small constant to times to avoid log(0)
-            times_adj = times + 1e-10
-            coeffs = np.polyfit(np.log(times_adj), absorbances, 1)
-            a, b = coeffs
-            
-            # Calculate predictions
-            y_pred = a * np.log(times_adj) + b
-            
-            # Calculate derivative (rate) at t=0
-            initial_rate = a / 1e-10  # derivative of a*ln(x) is a/x
-            
-            # Generate points for smooth curve
-            y_fit = a * np.log(x_fit + 1e-10) + b
-            
-            # Create equation string
-            if show_equation:
-                equation = f"y = {a:.2e}ln(x) + {b:.2e}"
-            
-        elif fit_type == 'exponential':
-            # Calculate better initial parameter guesses
-            # y0: estimate as the minimum value
-            y0_guess = np.min(absorbances)
-            
-            # a: estimate as the difference between max and min values
-            a_guess = np.max(absorbances) - y0_guess
-            
-            # b: estimate from the first few points using the slope
-            # For y = a*exp(-b*x) + y0, the slope at t=0 is -a*b
-            # We can estimate b from the initial slope
-            initial_slope = (absorbances[1] - absorbances[0]) / (times[1] - times[0])
-            b_guess = abs(initial_slope / a_guess) if a_guess != 0 else 0.1
-            
-            # Fit exponential curve using scipy's curve_fit with better initial guesses
-            coeffs, _ = curve_fit(inverse_exponential, times, absorbances, 
-                                p0=(a_guess, b_guess, y0_guess),
-                                maxfev=20000)  # Increase max iterations for better fit
-            a, b, y0 = coeffs
-
-            # NOTE: This is a hardcoded solution to the fact that the exponential curve is not fitting correctly
-            # Check here if there are any future problems
-            if (b < 0 or a < 0):
-                b = abs(b)
-                a = abs(a)
-            
-            # Calculate predictions
-            y_pred = inverse_exponential(times, a, b, y0)
-            
-            # Calculate derivative (rate) at t=0
-            initial_rate = 1 * a * b  # derivative of -a*exp(-b*x) + y0 is a*b*exp(-b*x)
-            
-            # Generate points for smooth curve
-            y_fit = inverse_exponential(x_fit, a, b, y0)
-            
-            # Create equation string
-            if show_equation:
-                equation = f"y = -{a:.2e}exp(-{b:.2e}x) + {y0:.2e}"
+        # Generate points for smooth curve
+        y_fit = poly(x_fit)
         
-        # Calculate R-squared
-        ss_tot = np.sum((absorbances - np.mean(absorbances))**2)
-        ss_res = np.sum((absorbances - y_pred)**2)
-        r_squared = 1 - (ss_res / ss_tot)
+        # Create equation string
+        if show_equation:
+            equation = f"y = {coeffs[0]:.2e}x³ + {coeffs[1]:.2e}x² + {coeffs[2]:.2e}x + {coeffs[3]:.2e}"
         
-        # Store initial rate
-        initial_rates[sample_name] = initial_rate
+    elif fit_type == 'logarithmic':
+        # Fit logarithmic curve: y = a * ln(x) + b
+        # Add small constant to times to avoid log(0)
+        times_adj = times + 1e-10
+        coeffs = np.polyfit(np.log(times_adj), absorbances, 1)
+        a, b = coeffs
         
-        # Create the plot
-        plt.figure(figsize=(10, 6))
-        plotly_fig = go.Figure()
+        # Calculate predictions
+        y_pred = a * np.log(times_adj) + b
         
-        # Plot scatter points
-        plt.scatter(times, absorbances, color='blue', label='Data points')
-        plotly_fig.add_trace(go.Scatter(x=times, y=absorbances, mode='markers', name='Data points'))
+        # Calculate derivative (rate) at the first reading after t=0, since a/x has no value at t=0
+        initial_rate = a / times[times > 0][0]  # derivative of a*ln(x) is a/x
         
-        # Plot best fit line
-        plt.plot(x_fit, y_fit, 'r-', label='Best fit line')
-        plotly_fig.add_trace(go.Scatter(x=x_fit, y=y_fit, mode='lines', name='Best fit line'))
+        # Generate points for smooth curve
+        y_fit = a * np.log(x_fit + 1e-10) + b
         
-        # Add fit information to plot
-        fit_info = f"R² = {r_squared:.4f}; \nInitial rate = {initial_rate:.2e} s⁻¹"
+        # Create equation string
         if show_equation:
-            fit_info = f"{equation}; \n{fit_info}"     
+            equation = f"y = {a:.2e}ln(x) + {b:.2e}"
+        
+    elif fit_type == 'exponential':
+        a, b, y0 = exponential_coeffs
 
-        plt.text(0.02, 0.98, fit_info, 
-                transform=plt.gca().transAxes, 
-                verticalalignment='top',
-                bbox=dict(boxstyle='round', facecolor='white', alpha=0.8))
+        # NOTE: This is a hardcoded solution to the fact that the exponential curve is not fitting correctly
+        # Check here if there are any future problems
+        if (b < 0 or a < 0):
+            b = abs(b)
+            a = abs(a)
         
-        plt.xlabel('Time (seconds)')
-        plt.ylabel('Absorbance')
-        plt.title(f'Absorbance vs Time for {sample_name}\nMax absorbance at {max_abs_row} nm')
-        plt.grid(True)
+        # Calculate predictions
+        y_pred = inverse_exponential(times, a, b, y0)
         
-        plotly_fig.update_layout(title=f'Absorbance vs Time for {sample_name}\nMax absorbance at {max_abs_row} nm',
-                                 xaxis_title='Time (seconds)',
-                                 yaxis_title='Absorbance',
-                                 showlegend = False)
-        plotly_fig.add_annotation(text=fit_info,
-                                  xref="paper",
-                                  yref="paper",
-                                  x=0.02,
-                                  y=0.98,
-                                  showarrow=False,
-                                  font=dict(size=12),
-                                  align='left')
+        # Calculate derivative (rate) at t=0
+        initial_rate = 1 * a * b  # derivative of -a*exp(-b*x) + y0 is a*b*exp(-b*x)
         
-        # Save the plot
-        plot_file = os.path.join(plot_dir, f'{sample_name}_rate_plot.png')
-        plt.savefig(plot_file, dpi=300, bbox_inches='tight')
-        plt.close()
-        print(f'Saved rate plot for {sample_name} to {plot_file}')
-
-        plotly_fig.write_html(os.path.join(interactive_plot_dir, f'{sample_name}_rate_plot.html'))
-        print(f'Saved interactive plot for {sample_name} to {os.path.join(interactive_plot_dir, f"{sample_name}_rate_plot.html")}')
-    print()
+        # Generate points for smooth curve
+        y_fit = inverse_exponential(x_fit, a, b, y0)
+        
+        # Create equation string
+        if show_equation:
+            equation = f"y = -{a:.2e}exp(-{b:.2e}x) + {y0:.2e}"
+
+    return initial_rate, y_pred, x_fit, y_fit, equation
+
+def determine_rate(dataframes, show_equation=False, fit_type='exponential', jobs=1, plotly_js='directory',
+                   output_root='output', wavelength=None, plots=True, plot_samples=None, per_sample_peak=False) -> dict:
+    """
+    Fit the absorbance over time of every sample and write the initial rates to initial_rates.csv.
+
+    wavelength may be a list: all wavelengths are fitted in one batch, column K holds the rates at
+    the first one and K_<wavelength>nm those at each of them. With per_sample_peak (or a wavelength
+    of 'peak') every sample is fitted at its own absorbance peak, recorded in peak_wavelength. The
+    rate plots show the first wavelength. Returns the rates at the first wavelength.
+    """
+    import pandas as pd
+
+    # Directory used to store the plots
+    plot_dir = os.path.join(output_root, 'rate_plots')
+    rate_dir = os.path.join(output_root, 'initial_rates')
+    interactive_plot_dir = os.path.join(plot_dir, 'interactive_plots')
+
+    # The wavelengths to determine the rates at
+    targets = resolve_wavelengths(dataframes, wavelength, per_sample_peak)
+    first_df = next(iter(dataframes.values()))
+    rows = wavelength_rows(first_df.index)
+    peaks = {name: peak_wavelength(df) for name, df in dataframes.items()} if 'peak' in targets else {}
+    sample_wavelengths = [[peaks[name] if target == 'peak' else target for target in targets] for name in dataframes]
+
+    # Plot every sample, unless only some of them are asked for
+    plot_samples = [name for name in dataframes if plot_samples is None or name in plot_samples]
+
+    # Dictionary to store initial rates
+    initial_rates = {}
+    rate_columns = {}
+    # order = int(input("Enter your choice (0/1/2): "))
+    
+    # Collect the time series (rows of absorbance values) at the wavelengths of every sample into one
+    # (samples, wavelengths, timepoints) array so the fits can be done together
+    absorbance_cube = np.array([df.to_numpy()[[rows[w] for w in wavelengths]]
+                                for df, wavelengths in zip(dataframes.values(), sample_wavelengths)])
+
+    # Convert time points to numeric values (remove 's' and convert to float)
+    times = np.array([float(t.replace('s', '')) for t in first_df.columns])
+
+    # Fit the exponential curves of all samples and wavelengths in one batch
+    if fit_type == 'exponential':
+        exponential_coeffs, exponential_info = fit_inverse_exponential_batch(
+            times, absorbance_cube.reshape(-1, len(times)), return_info=True)
+
+    # How each fit was found and how long it took
+    fit_diagnostics = []
+
+    # Plot jobs, rendered once all samples are fitted
+    plot_jobs = []
+
+    # Process each sample
+    for i, sample_name in enumerate(dataframes):
+        rate_columns[sample_name] = {}
+        for j, (target, max_abs_row) in enumerate(zip(targets, sample_wavelengths[i])):
+            absorbances = absorbance_cube[i, j]
+            fit = i * len(targets) + j
+            fit_start = time.perf_counter()
+            initial_rate, y_pred, x_fit, y_fit, equation = fit_rate_curve(
+                times, absorbances, fit_type, show_equation,
+                exponential_coeffs[fit] if fit_type == 'exponential' else None)
+
+            # The polynomial and logarithmic fits are linear least squares, solved without iterating
+            if fit_type == 'exponential':
+                if exponential_info['method'][fit] == 'failed':
+                    print(f"Warning: the exponential fit of sample {sample_name} at {max_abs_row} nm did not "
+                          f"converge; using the best estimate found.")
+                fit_diagnostics.append({'sample': sample_name, 'wavelength': max_abs_row,
+                                        'method': exponential_info['method'][fit],
+                                        'iterations': exponential_info['iterations'][fit],
+                                        'time_s': exponential_info['time_s'][fit],
+                                        'batch_time_s': exponential_info['batch_time_s']})
+            else:
+                fit_diagnostics.append({'sample': sample_name, 'wavelength': max_abs_row, 'method': 'linear',
+                                        'iterations': 0, 'time_s': time.perf_counter() - fit_start})
+
+            if len(targets) > 1:
+                rate_columns[sample_name]['K_peak' if target == 'peak' else f'K_{target}nm'] = initial_rate
+            if j > 0:
+                continue
+            
+            # Calculate R-squared
+            ss_tot = np.sum((absorbances - np.mean(absorbances))**2)
+            ss_res = np.sum((absorbances - y_pred)**2)
+            r_squared = 1 - (ss_res / ss_tot)
+            
+            # Store initial rate
+            initial_rates[sample_name] = initial_rate
+            
+            # Add fit information to plot
+            fit_info = f"R² = {r_squared:.4f}; \nInitial rate = {initial_rate:.2e} s⁻¹"
+            if show_equation:
+                fit_info = f"{equation}; \n{fit_info}"
+
+            # Queue the plot; only the points and fitted curve are sent to the renderer
+            if sample_name in plot_samples:
+                plot_jobs.append((sample_name, times, absorbances, x_fit, y_fit, fit_info, max_abs_row, plot_dir, interactive_plot_dir, plotly_js))
+
+    # Create the plots
+    if plots:
+        write_plotly_bundle(interactive_plot_dir, plotly_js, refresh=bool(plot_jobs))
+        for sample_name, (plot_file, html_file) in zip(plot_samples, run_plot_jobs(render_rate_plot, plot_jobs, jobs)):
+            print(f'Saved rate plot for {sample_name} to {plot_file}')
+            print(f'Saved interactive plot for {sample_name} to {html_file}')
+        print()
     # Save initial rates to CSV
     rates_df = pd.DataFrame({'K': initial_rates})
+    if peaks:
+        rates_df['peak_wavelength'] = pd.Series(peaks)
+    if len(targets) > 1:
+        rates_df = rates_df.join(pd.DataFrame.from_dict(rate_columns, orient='index'))
     rates_csv_file = os.path.join(rate_dir, 'initial_rates.csv')
-    rates_df.to_csv(rates_csv_file)
+    write_output(rates_csv_file, rates_df.to_csv)
     print(f'Saved initial rates to {rates_csv_file}')
+    diagnostics_df = pd.DataFrame(fit_diagnostics).set_index('sample')
+    diagnostics_df.insert(0, 'fit', fit_type)
+    diagnostics_csv_file = os.path.join(rate_dir, 'fit_diagnostics.csv')
+    write_output(diagnostics_csv_file, diagnostics_df.to_csv)
+    print(f'Saved fit diagnostics to {diagnostics_csv_file}')
+
+    if not plots:
+        return initial_rates
 
     # Save the initial rates as an image
+    import matplotlib.pyplot as plt
     fig, ax = plt.subplots(figsize=(8, len(initial_rates) * 0.4 + 1))  # Reduced height multiplier and base height
     ax.axis('tight')
     ax.axis('off')
@@ -403,14 +1060,551 @@ def determine_rate(dataframes, show_equation=False, fit_type='exponential') -> d
     
     # Save figure
     rates_image_file = os.path.join(rate_dir, 'initial_rates.png')
-    plt.savefig(rates_image_file, bbox_inches='tight', dpi=300)
+    write_figure(rates_image_file, plt, bbox_inches='tight', dpi=300)
     plt.close()
 
+    return initial_rates
+
+
+# ----- Replicate functions ---------------------------------------------------------------------------
+# Replicate wells are grouped by name, with a mapping file or by removing a pattern from the sample
+# names, and summarised by the mean and standard deviation of their rates and a bootstrap confidence
+# interval of the mean. The rates come from the one batched fit of all samples.
+
+def read_replicate_map(map_file) -> dict:
+    # Sample name -> group name, from a CSV file with a sample and a group column (the header is optional)
+    with open(map_file, newline='') as f:
+        rows = [row for row in csv.reader(f) if len(row) >= 2 and row[0].strip()]
+    if rows and [cell.strip().lower() for cell in rows[0][:2]] == ['sample', 'group']:
+        rows = rows[1:]
+    return {row[0].strip(): row[1].strip() for row in rows}
+
+def replicate_groups(sample_names, replicate_map=None, pattern=None) -> dict:
+    """
+    Group name -> the names of its samples. With a replicate_map the groups are looked up, otherwise
+    they are the sample names with the pattern (a regular expression, e.g. '_r\\d+$') removed.
+    Samples that are not in the map form a group of their own, and map entries that match no sample
+    are reported, since they usually mean a misspelt sample name.
+    """
+    groups = {}
+    for sample_name in sample_names:
+        sample_name = str(sample_name)
+        if replicate_map is not None:
+            group = replicate_map.get(sample_name, sample_name)
+        else:
+            group = re.sub(pattern, '', sample_name) or sample_name
+        groups.setdefault(group, []).append(sample_name)
+
+    if replicate_map is not None:
+        found = {name for names in groups.values() for name in names}
+        unmatched = [name for name in replicate_map if name not in found]
+        if unmatched:
+            print(f"Warning: {len(unmatched)} sample(s) in the replicate file are not in the data: {', '.join(unmatched)}")
+    return groups
+
+def bootstrap_mean_intervals(values, n_bootstrap=10000, confidence=0.95, seed=0):
+    """
+    Percentile bootstrap confidence intervals of the mean of every group in values, a list of arrays.
+
+    The resamples are drawn for all groups of the same size at once, as a (groups, n_bootstrap, size)
+    array of indices, so there is no loop over resamples. A fixed seed keeps the intervals the same
+    from run to run. Returns (low, high) arrays; groups with fewer than 2 values get NaN.
+    """
+    rng = np.random.default_rng(seed)
+    counts = np.array([len(group) for group in values])
+    low = np.full(len(values), np.nan)
+    high = np.full(len(values), np.nan)
+    tail = (1 - confidence) / 2 * 100
+
+    for size in np.unique(counts[counts > 1]):
+        rows = np.flatnonzero(counts == size)
+        group_values = np.array([values[i] for i in rows], dtype=float)
+
+        # Resample every group with replacement and take the mean of each resample
+        picks = rng.integers(0, size, (len(rows), n_bootstrap, size))
+        means = group_values[np.arange(len(rows))[:, None, None], picks].mean(axis=2)
+        low[rows], high[rows] = np.percentile(means, [tail, 100 - tail], axis=1)
+
+    return low, high
+
+def replicate_statistics(initial_rates, groups, n_bootstrap=10000, confidence=0.95):
+    """
+    Summarise the initial rates of every replicate group: the number of samples, the mean rate, its
+    standard deviation (n-1) and the bootstrap confidence interval of the mean, as a DataFrame.
+    """
+    import pandas as pd
+
+    values = [np.array([initial_rates[name] for name in names], dtype=float) for names in groups.values()]
+    low, high = bootstrap_mean_intervals(values, n_bootstrap, confidence)
+    level = f'{confidence * 100:g}'
+
+    stats = pd.DataFrame({
+        'samples': [';'.join(names) for names in groups.values()],
+        'n': [len(group) for group in values],
+        'K_mean': [group.mean() for group in values],
+        'K_std': [group.std(ddof=1) if len(group) > 1 else np.nan for group in values],
+        f'K_ci{level}_low': low,
+        f'K_ci{level}_high': high,
+    }, index=pd.Index(list(groups), name='group'))
+    return stats
+
+def save_replicate_rates(initial_rates, groups, output_root='output', n_bootstrap=10000, confidence=0.95) -> None:
+    stats = replicate_statistics(initial_rates, groups, n_bootstrap, confidence)
+    replicate_csv_file = os.path.join(output_root, 'initial_rates', 'replicate_rates.csv')
+    write_output(replicate_csv_file, stats.to_csv)
+    print(f'Saved rates of {len(stats)} replicate groups to {replicate_csv_file}')
+
+# ----- Cache functions -------------------------------------------------------------------------------
+# Parsed and normalised experiments are cached as .npy arrays, keyed by a hash of the CSV contents
+# and the parameters used to parse it. A re-run with the same file and run time/interval memory-maps
+# the arrays instead of parsing and normalising again.
+
+CACHE_VERSION = 1
+# Changed whenever the fitting changes, so rates from an earlier version are determined again
+RATE_VERSION = 2
+
+def file_digest(path) -> str:
+    # SHA-256 of the file contents, read in blocks
+    sha = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            sha.update(block)
+    return sha.hexdigest()
+
+def fingerprint(*parts) -> str:
+    # Short hash identifying a combination of inputs and parameters
+    return hashlib.sha256('|'.join(str(part) for part in parts).encode()).hexdigest()[:32]
+
+def cache_key(csv_file, run_time, interval, num_samples=0, dtype=np.float64, digest=None) -> str:
+    # digest is the file_digest of csv_file, if it is already known
+    return fingerprint(CACHE_VERSION, digest or file_digest(csv_file), float(run_time), float(interval),
+                       num_samples, np.dtype(dtype).name)
+
+def save_stacked(path, arrays, count) -> None:
+    # Write count equally shaped arrays as one .npy file, one at a time, without stacking them in memory first
+    stacked = None
+    for i, array in enumerate(arrays):
+        if stacked is None:
+            stacked = np.lib.format.open_memmap(path, mode='w+', dtype=array.dtype, shape=(count,) + array.shape)
+        stacked[i] = array
+    stacked.flush()
+    del stacked
+
+def save_to_cache(cache_dir, key, csv_file, processed_dataframes, normalised_dataframes, correction_values) -> None:
+    entry_dir = os.path.join(cache_dir, key)
+    if os.path.isdir(entry_dir):
+        return
+    os.makedirs(cache_dir, exist_ok=True)
+
+    first_df = next(iter(processed_dataframes.values()))
+    meta = {
+        'version': CACHE_VERSION,
+        'source': os.path.abspath(csv_file),
+        'sample_names': list(processed_dataframes),
+        'wavelengths': first_df.index.tolist(),
+        'wavelength_label': first_df.index.name,
+        'time_points': list(first_df.columns),
+        'baseline_wavelengths': [int(c.name) for c in correction_values.values()],
+    }
+
+    # Write into a temporary folder first so an interrupted run never leaves a half-written entry
+    temp_dir = tempfile.mkdtemp(dir=cache_dir, prefix='.tmp-')
+    try:
+        count = len(processed_dataframes)
+        save_stacked(os.path.join(temp_dir, 'processed.npy'), (df.to_numpy() for df in processed_dataframes.values()), count)
+        save_stacked(os.path.join(temp_dir, 'normalised.npy'), (df.to_numpy() for df in normalised_dataframes.values()), count)
+        save_stacked(os.path.join(temp_dir, 'corrections.npy'), (c.to_numpy() for c in correction_values.values()), count)
+        with open(os.path.join(temp_dir, 'meta.json'), 'w') as f:
+            json.dump(meta, f)
+        os.rename(temp_dir, entry_dir)
+    except OSError:
+        shutil.rmtree(temp_dir, ignore_errors=True)
+        return
+
+    # Entries for older versions of the same file (or other parameters) are no longer needed
+    for other_key in os.listdir(cache_dir):
+        other_meta = os.path.join(cache_dir, other_key, 'meta.json')
+        if other_key == key or not os.path.isfile(other_meta):
+            continue
+        try:
+            with open(other_meta) as f:
+                if json.load(f).get('source') == meta['source']:
+                    shutil.rmtree(os.path.join(cache_dir, other_key), ignore_errors=True)
+        except (OSError, ValueError):
+            continue
+
+def load_from_cache(cache_dir, key):
+    """Memory-map a cached experiment, returning (processed_dataframes, normalised_dataframes, correction_values) or None."""
+    entry_dir = os.path.join(cache_dir, key)
+    try:
+        with open(os.path.join(entry_dir, 'meta.json')) as f:
+            meta = json.load(f)
+        processed = np.load(os.path.join(entry_dir, 'processed.npy'), mmap_mode='r')
+        normalised = np.load(os.path.join(entry_dir, 'normalised.npy'), mmap_mode='r')
+        corrections = np.load(os.path.join(entry_dir, 'corrections.npy'), mmap_mode='r')
+    except (OSError, ValueError):
+        return None
+    if meta.get('version') != CACHE_VERSION:
+        return None
+
+    import pandas as pd
+    wavelengths = pd.Index(meta['wavelengths'], name=meta['wavelength_label'])
+    time_points = meta['time_points']
+    baseline_wavelengths = meta.get('baseline_wavelengths') or [None] * len(meta['sample_names'])
+
+    processed_dataframes = {}
+    normalised_dataframes = {}
+    correction_values = {}
+    for i, sample_name in enumerate(meta['sample_names']):
+        processed_dataframes[sample_name] = pd.DataFrame(processed[i], index=wavelengths, columns=time_points, copy=False)
+        normalised_dataframes[sample_name] = pd.DataFrame(normalised[i], index=wavelengths, columns=time_points, copy=False)
+        correction_values[sample_name] = pd.Series(corrections[i], index=time_points, name=baseline_wavelengths[i])
+    return processed_dataframes, normalised_dataframes, correction_values
+
+# ----- Manifest functions ----------------------------------------------------------------------------
+# Every output file is recorded in output/.uvp_manifest.json together with a fingerprint of the data
+# and parameters it was made from. Like make, a re-run only rebuilds the files whose fingerprint has
+# changed or that are missing, e.g. only the rate stage when just the wavelength changes.
+
+MANIFEST_NAME = '.uvp_manifest.json'
+
+def load_manifest(output_root) -> dict:
+    try:
+        with open(os.path.join(output_root, MANIFEST_NAME)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def save_manifest(output_root, manifest) -> None:
+    manifest_file = os.path.join(output_root, MANIFEST_NAME)
+    with open(manifest_file + '.tmp', 'w') as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+    os.replace(manifest_file + '.tmp', manifest_file)
+
+def is_up_to_date(manifest, output_root, paths, fingerprint) -> bool:
+    # All files exist and were made from the same inputs
+    return all(manifest.get(os.path.relpath(path, output_root), {}).get('fingerprint') == fingerprint
+               and os.path.exists(path) for path in paths)
+
+def record_outputs(manifest, output_root, paths, fingerprint, inputs) -> None:
+    for path in paths:
+        manifest[os.path.relpath(path, output_root)] = {'fingerprint': fingerprint, 'inputs': inputs}
+
+def sample_outputs(output_root, sample_name, bundle=None) -> dict:
+    # The files written for one sample by each stage; bundled CSVs share one file per stage
+    return {
+        'processed': [bundle_file(output_root, 'processed_uv_data', bundle) if bundle else
+                      os.path.join(output_root, 'processed_uv_data', f'{sample_name}_uv_data.csv')],
+        'normalised': [bundle_file(output_root, 'normalised_uv_data', bundle) if bundle else
+                       os.path.join(output_root, 'normalised_uv_data', f'{sample_name}_normalised.csv')],
+        'absorbance_plot': [os.path.join(output_root, 'normalised_plots', f'{sample_name}_absorbance_plot.png'),
+                            os.path.join(output_root, 'normalised_plots', 'interactive_plots', f'{sample_name}_absorbance_plot.html')],
+        'rate_plot': [os.path.join(output_root, 'rate_plots', f'{sample_name}_rate_plot.png'),
+                      os.path.join(output_root, 'rate_plots', 'interactive_plots', f'{sample_name}_rate_plot.html')],
+    }
+
+# ----- Pipeline functions -----------------------------------------------------------------------------
+
+def create_output_dirs(output_root, plots=True):
+    # Create the output directories for one experiment
+    sub_dirs = ['processed_uv_data', 'normalised_uv_data', 'initial_rates']
+    if plots:
+        sub_dirs += ['normalised_plots', 'rate_plots', 'normalised_plots/interactive_plots', 'rate_plots/interactive_plots']
+    for sub_dir in sub_dirs:
+        os.makedirs(os.path.join(output_root, sub_dir), exist_ok=True)
+
+def run_pipeline(csv_file, output_root, run_time, interval, num_samples=0, show_equation=False,
+                 fit_type='exponential', wavelength=None, jobs=1, plotly_js='directory', plots=True,
+                 dtype=np.float64, cache_dir=None, force=False, per_sample_peak=False, bundle=None,
+                 replicate_map=None, replicate_pattern=None, n_bootstrap=10000, confidence=0.95,
+                 max_traces=0, spectra_style='lines') -> dict:
+    import pandas as pd
+
+    # Everything below depends on the file contents and the parameters used to parse it
+    # The file is hashed once: large exports take seconds to read
+    digest = file_digest(csv_file)
+    key = cache_key(csv_file, run_time, interval, num_samples, dtype, digest)
+    data_inputs = {'file': digest, 'run_time': run_time, 'interval': interval,
+                   'num_samples': num_samples, 'dtype': np.dtype(dtype).name}
+    manifest = {} if force else load_manifest(output_root)
+
+    # Reuse the parsed and normalised data of an earlier run on the same file, if there is one
+    cached = load_from_cache(cache_dir, key) if cache_dir else None
+
+    if cached:
+        print(f'Loaded processed and normalised data from the cache in {cache_dir}')
+        print()
+        processed_dataframes, normalized_dataframes, correction_values = cached
+    else:
+        # Process the data; the CSV files are written below
+        processed_dataframes = process_uv_data(csv_file, run_time, interval, output_root=output_root,
+                                               num_samples=num_samples, dtype=dtype, bundle=bundle, save=False)
+
+        # Normalize the data
+        normalized_dataframes, correction_values = compute_normalisation(processed_dataframes, dtype)
+
+        if cache_dir and processed_dataframes:
+            save_to_cache(cache_dir, key, csv_file, processed_dataframes, normalized_dataframes, correction_values)
+
+    # Only write the CSV files that are out of date (a bundle holds every sample, so it is all or none)
+    save_processed_data({name: df for name, df in processed_dataframes.items()
+                         if not is_up_to_date(manifest, output_root, sample_outputs(output_root, name, bundle)['processed'], key)},
+                        output_root, bundle)
+    save_normalised_data({name: df for name, df in normalized_dataframes.items()
+                          if not is_up_to_date(manifest, output_root, sample_outputs(output_root, name, bundle)['normalised'], key)},
+                         correction_values, output_root, bundle)
+
+    for name in processed_dataframes:
+        outputs = sample_outputs(output_root, name, bundle)
+        record_outputs(manifest, output_root, outputs['processed'] + outputs['normalised'], key, data_inputs)
+    save_manifest(output_root, manifest)
+
+    # Create plots for normalized data, for the samples whose plots are out of date
+    if plots:
+        plot_key = fingerprint(key, plotly_js, max_traces, spectra_style)
+        stale = [name for name in normalized_dataframes
+                 if not is_up_to_date(manifest, output_root, sample_outputs(output_root, name)['absorbance_plot'], plot_key)]
+        if stale:
+            plot_absorbance_data(normalized_dataframes, jobs=jobs, plotly_js=plotly_js, output_root=output_root,
+                                 plot_samples=stale, max_traces=max_traces, style=spectra_style)
+        else:
+            print('Absorbance plots are up to date.')
+            print()
+        for name in stale:
+            record_outputs(manifest, output_root, sample_outputs(output_root, name)['absorbance_plot'], plot_key,
+                           dict(data_inputs, plotly_js=plotly_js, max_traces=max_traces, spectra_style=spectra_style))
+        save_manifest(output_root, manifest)
+
+    # Create rate plots for normalized data and determine initial rates, unless nothing they depend on changed
+    wavelengths = resolve_wavelengths(normalized_dataframes, wavelength, per_sample_peak)
+    rate_key = fingerprint(key, RATE_VERSION, wavelengths, fit_type, show_equation)
+    rate_inputs = dict(data_inputs, wavelength=wavelengths, fit_type=fit_type, show_equation=show_equation)
+    rate_files = [os.path.join(output_root, 'initial_rates', 'initial_rates.csv'),
+                  os.path.join(output_root, 'initial_rates', 'fit_diagnostics.csv')]
+    if plots:
+        rate_files.append(os.path.join(output_root, 'initial_rates', 'initial_rates.png'))
+    plot_key = fingerprint(rate_key, plotly_js)
+    stale = [name for name in normalized_dataframes
+             if plots and not is_up_to_date(manifest, output_root, sample_outputs(output_root, name)['rate_plot'], plot_key)]
+
+    if stale or not is_up_to_date(manifest, output_root, rate_files, rate_key):
+        initial_rates = determine_rate(normalized_dataframes, show_equation=show_equation, fit_type=fit_type, jobs=jobs,
+                                       plotly_js=plotly_js, output_root=output_root, wavelength=wavelengths, plots=plots,
+                                       plot_samples=stale)
+    else:
+        print('Initial rates and rate plots are up to date.')
+        # Sample names stay strings, even when they look like numbers (or 'NA')
+        initial_rates = pd.read_csv(rate_files[0], index_col=0, dtype={0: str}, keep_default_na=False,
+                                    float_precision='round_trip')['K'].to_dict()
+
+    record_outputs(manifest, output_root, rate_files, rate_key, rate_inputs)
+    for name in stale:
+        record_outputs(manifest, output_root, sample_outputs(output_root, name)['rate_plot'], plot_key,
+                       dict(rate_inputs, plotly_js=plotly_js))
+
+    # Summarise the rates of replicate wells, if they are grouped
+    if replicate_map is not None or replicate_pattern:
+        groups = replicate_groups(initial_rates, replicate_map, replicate_pattern)
+        replicate_file = [os.path.join(output_root, 'initial_rates', 'replicate_rates.csv')]
+        replicate_key = fingerprint(rate_key, groups, n_bootstrap, confidence)
+        if is_up_to_date(manifest, output_root, replicate_file, replicate_key):
+            print('Replicate rates are up to date.')
+        else:
+            save_replicate_rates(initial_rates, groups, output_root, n_bootstrap, confidence)
+            record_outputs(manifest, output_root, replicate_file, replicate_key,
+                           dict(rate_inputs, groups=groups, n_bootstrap=n_bootstrap, confidence=confidence))
+
+    # Wait for the files still being written. Those that failed are left out of the manifest, so the
+    # next run writes them again
+    failed = flush_writes()
+    for path, error in failed:
+        print(f"Error writing {path}: {error}")
+        manifest.pop(os.path.relpath(path, output_root), None)
+    save_manifest(output_root, manifest)
+    if failed:
+        raise OSError(f"{len(failed)} output file(s) could not be written")
+
+    return initial_rates
+
+def batch_output_root(csv_file, output=None):
+    # In batch mode every export gets its own folder, named after the file, inside the output folder
+    if output is None:
+        output = os.path.join(os.path.dirname(os.path.abspath(csv_file)), 'output')
+    return os.path.join(output, os.path.splitext(os.path.basename(csv_file))[0])
+
+def cache_dir_for(output_dir) -> str:
+    # The cache lives next to the output folder
+    return os.path.join(os.path.dirname(os.path.abspath(output_dir)), '.uvp_cache')
+
+def expand_inputs(inputs) -> list:
+    # Expand glob patterns and directories (the Windows shell does not do this for us)
+    csv_files = []
+    for pattern in inputs:
+        if os.path.isdir(pattern):
+            csv_files.extend(sorted(glob.glob(os.path.join(pattern, '*.csv'))))
+        elif any(char in pattern for char in '*?['):
+            csv_files.extend(sorted(glob.glob(pattern)))
+        else:
+            csv_files.append(pattern)
+    return csv_files
+
+def process_files(csv_files, settings, output=None, cache=True) -> list:
+    # Run the pipeline on every file, collecting failures instead of stopping at the first one
+    failed = []
+    for csv_file in csv_files:
+        print(f"===== {csv_file} =====")
+        try:
+            if not os.path.isfile(csv_file):
+                raise FileNotFoundError("File does not exist.")
+            output_root = batch_output_root(csv_file, output)
+            create_output_dirs(output_root, settings.get('plots', True))
+            cache_dir = cache_dir_for(os.path.dirname(output_root)) if cache else None
+            run_pipeline(csv_file, output_root, cache_dir=cache_dir, **settings)
+        except Exception as e:
+            print(f"Error processing {csv_file}: {e}")
+            failed.append(csv_file)
+        print()
+    return failed
+
+def watch_directory(watch_dir, settings, output=None, poll_interval=5.0, cache=True) -> None:
+    # Poll the directory for new (or rewritten) CSV exports and process each one once it has
+    # stopped growing, so files that are still being written are not picked up half-way
+    def signature(path):
+        stat = os.stat(path)
+        return stat.st_size, stat.st_mtime
+
+    done = {path: signature(path) for path in glob.glob(os.path.join(watch_dir, '*.csv'))}
+    pending = {}
+    print(f"Watching {watch_dir} for new CSV files (Ctrl+C to stop)...")
+    try:
+        while True:
+            for path in sorted(glob.glob(os.path.join(watch_dir, '*.csv'))):
+                try:
+                    current = signature(path)
+                except OSError:
+                    continue
+                if done.get(path) == current:
+                    continue
+                if pending.get(path) == current:
+                    del pending[path]
+                    done[path] = current
+                    process_files([path], settings, output, cache)
+                else:
+                    pending[path] = current
+            time.sleep(poll_interval)
+    except KeyboardInterrupt:
+        print("\nStopped watching.")
+
+def wavelength_list(text) -> list:
+    # Comma-separated wavelengths, e.g. '595,620'
+    return [int(wavelength) for wavelength in text.split(',')]
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Process UV absorbance data and determine initial rates. '
+                    'Run without CSV files to be asked for the settings interactively.',
+        fromfile_prefix_chars='@',
+        epilog='Options can also be read from a file, one per line: UVP @settings.txt data/*.csv')
+    parser.add_argument('inputs', nargs='*',
+                        help='CSV files, glob patterns or directories of CSV files to process')
+    parser.add_argument('--run-time', type=float,
+                        help='total run time of the UV experiment in seconds')
+    parser.add_argument('--interval', type=float,
+                        help='time interval between readings in seconds')
+    parser.add_argument('--samples', type=int, default=0,
+                        help='number of samples, 0 to determine it from the file (default: 0)')
+    parser.add_argument('--fit', choices=['exponential', 'polynomial', 'logarithmic'], default='exponential',
+                        help='type of curve fit for the rate plots (default: exponential)')
+    parser.add_argument('--equation', action='store_true',
+                        help='show the fitted equation on the rate plots')
+    parser.add_argument('--wavelength', type=wavelength_list, default=[0],
+                        help='wavelength (nm) used for the rates, 0 to determine it from the first sample (default: 0); '
+                             'several can be given separated by commas (e.g. 595,620), the rates at each are then '
+                             'fitted together and written as K_<wavelength>nm columns')
+    parser.add_argument('--peak-per-sample', dest='per_sample_peak', action='store_true',
+                        help='determine the rates of each sample at its own absorbance peak, instead of at the peak '
+                             'of the first sample (used where --wavelength is 0)')
+    parser.add_argument('--output',
+                        help="folder for the results; each CSV gets a sub-folder named after it (default: 'output' next to each CSV)")
+    parser.add_argument('--watch', metavar='DIR',
+                        help='keep running and process new CSV files as they appear in DIR')
+    parser.add_argument('--poll', type=float, default=5.0,
+                        help='seconds between checks of the watched folder (default: 5)')
+    parser.add_argument('--no-plots', '--csv-only', dest='plots', action='store_false',
+                        help='only write the CSV files (processed data, normalised data and initial rates); '
+                             'matplotlib and plotly are never loaded')
+    parser.add_argument('--float32', dest='dtype', action='store_const', const=np.float32, default=np.float64,
+                        help='store the absorbance data as 32-bit floats, halving the memory needed for large '
+                             'exports (values are then written with float32 precision)')
+    parser.add_argument('--no-cache', dest='cache', action='store_false',
+                        help="always parse the CSV files, instead of reusing the data cached in '.uvp_cache' by earlier runs")
+    parser.add_argument('--force', action='store_true',
+                        help='rebuild every output file, even those that are up to date with the data and settings')
+    parser.add_argument('--jobs', type=int, default=1,
+                        help='number of worker processes used to render the plots (default: 1)')
+    parser.add_argument('--max-traces', type=int, default=0,
+                        help='most time points drawn in an absorbance plot; longer runs are thinned to this many '
+                             'evenly spaced time points (default: 0, draw them all)')
+    parser.add_argument('--spectra', dest='spectra_style', choices=['lines', 'collection', 'heatmap'], default='lines',
+                        help="how the absorbance plots show the time points: a line each ('lines', default), lines "
+                             "coloured by time ('collection'), or an image of wavelength against time ('heatmap')")
+    parser.add_argument('--replicates', metavar='CSV',
+                        help='CSV file mapping sample names (first column) to replicate groups (second column); '
+                             'the mean, standard deviation and bootstrap confidence interval of the rates of each '
+                             "group are written to 'replicate_rates.csv'")
+    parser.add_argument('--replicate-pattern', metavar='REGEX',
+                        help=r"group replicates by their sample names with REGEX removed, e.g. '_r\d+$' groups "
+                             "'WT_r1' and 'WT_r2' as 'WT'")
+    parser.add_argument('--bootstrap', type=int, default=10000,
+                        help='number of bootstrap resamples for the confidence intervals of replicates (default: 10000)')
+    parser.add_argument('--confidence', type=float, default=95,
+                        help='confidence level of the replicate intervals, in percent (default: 95)')
+    parser.add_argument('--writers', type=int, default=4,
+                        help='number of background threads writing the output files, 0 to write them before '
+                             'going on (default: 4)')
+    parser.add_argument('--bundle', choices=['zip', 'xlsx'],
+                        help='write the processed and normalised data of all samples into one zip archive of CSVs, '
+                             'or one Excel workbook with a sheet per sample, instead of a CSV per sample')
+    parser.add_argument('--plotly-js', choices=['directory', 'inline', 'cdn'], default='directory',
+                        help="how the interactive plots get plotly.js: one shared 'plotly.min.js' next to them "
+                             "(default), embedded in every file ('inline'), or loaded from the plotly CDN ('cdn')")
+    args = parser.parse_args(argv)
+
+    if (args.inputs or args.watch) and (args.run_time is None or args.interval is None):
+        parser.error('--run-time and --interval are required when CSV files or --watch are given')
+    if args.watch and not os.path.isdir(args.watch):
+        parser.error(f"the directory '{args.watch}' does not exist")
+    if args.poll <= 0:
+        parser.error('--poll must be more than 0 seconds')
+    if args.replicates and not os.path.isfile(args.replicates):
+        parser.error(f"the replicate file '{args.replicates}' does not exist")
+    if args.replicate_pattern:
+        try:
+            re.compile(args.replicate_pattern)
+        except re.error as e:
+            parser.error(f"invalid --replicate-pattern: {e}")
+    if not 0 < args.confidence < 100:
+        parser.error('--confidence must be between 0 and 100')
+    if args.bootstrap < 1:
+        parser.error('--bootstrap must be 1 or more')
+    if args.max_traces < 0:
+        parser.error('--max-traces must be 0 or more')
+    if args.bundle == 'xlsx':
+        from importlib.util import find_spec
+        if find_spec('openpyxl') is None:
+            parser.error("--bundle xlsx needs openpyxl (pip install openpyxl)")
+    return args
 
 # ----- Main method -------------------------------------------------------------------------------------
 
+def replicate_settings(args) -> dict:
+    # The replicate grouping is read once, for every file processed
+    return dict(replicate_map=read_replicate_map(args.replicates) if args.replicates else None,
+                replicate_pattern=args.replicate_pattern, n_bootstrap=args.bootstrap,
+                confidence=args.confidence / 100)
+
+def interactive_main(args):
     # Get the CSV file path from user
-def main():
     csv_file = input("Enter the path to your CSV file: ").strip('"')
 
     # Validate the path
@@ -421,18 +1615,9 @@ def main():
     # Set base_dir to the directory containing the CSV file
     base_dir = os.path.dirname(os.path.abspath(csv_file))
 
-    # Optionally change working directory to base_dir (optional)
-    os.chdir(base_dir)
-
     # Create directories relative to the CSV file's location
-    os.makedirs(os.path.join(base_dir, 'output'), exist_ok=True)
-    os.makedirs(os.path.join(base_dir, 'output/processed_uv_data'), exist_ok=True)
-    os.makedirs(os.path.join(base_dir, 'output/normalised_uv_data'), exist_ok=True)
-    os.makedirs(os.path.join(base_dir, 'output/normalised_plots'), exist_ok=True)
-    os.makedirs(os.path.join(base_dir, 'output/rate_plots'), exist_ok=True)
-    os.makedirs(os.path.join(base_dir, 'output/normalised_plots/interactive_plots'), exist_ok=True)
-    os.makedirs(os.path.join(base_dir, 'output/rate_plots/interactive_plots'), exist_ok=True)
-    os.makedirs(os.path.join(base_dir, 'output/initial_rates'), exist_ok=True)
+    output_root = os.path.join(base_dir, 'output')
+    create_output_dirs(output_root, args.plots)
 
     print("Directories made successfully in:\n", base_dir)
     print()
@@ -463,18 +1648,12 @@ def main():
         '3': 'logarithmic'
     }.get(fit_choice, 'exponential')  # Default to exponential if invalid choice
     
-    # Process the data
-    processed_dataframes = process_uv_data(csv_file, run_time, interval)
+    run_pipeline(csv_file, output_root, run_time, interval, num_samples=num_samples, show_equation=show_equation,
+                 fit_type=fit_type, jobs=args.jobs, plotly_js=args.plotly_js, plots=args.plots, dtype=args.dtype,
+                 cache_dir=cache_dir_for(output_root) if args.cache else None, force=args.force,
+                 per_sample_peak=args.per_sample_peak, bundle=args.bundle, max_traces=args.max_traces,
+                 spectra_style=args.spectra_style, **replicate_settings(args))
 
-    # Normalize the data
-    normalized_dataframes = normalize_data(processed_dataframes)
-    
-    # Create plots for normalized data
-    plot_absorbance_data(normalized_dataframes)
-    
-    # Create rate plots for normalized data and determine initial rates
-    determine_rate(normalized_dataframes, show_equation=show_equation, fit_type=fit_type)
-    
     print("\nProcessing complete! Check the following directories for results:")
     print("- processed_uv_data: Individual CSV files for each sample")
     print("- normalised_uv_data: Normalized versions of the data")
@@ -482,8 +1661,40 @@ def main():
     print("- normalised_plots/interactive_plots: HTML interactive plots of wavelength vs absorbance")
     print("- rate_plots: Time vs absorbance plots with rate analysis")
     print("- rate_plots/interactive_plots: HTML interactive plots of time vs absorbance")
-    print("- initial_rates: Contains initial rates CSV and image files")
+    print("- initial_rates: Contains initial rates CSV and image files, and the fit diagnostics")
+
+def main(argv=None):
+    args = parse_args(argv)
+    start_writer(args.writers)
+    try:
+        # Without any files to process, ask for everything as before
+        if not args.inputs and not args.watch:
+            interactive_main(args)
+            return 0
+
+        settings = dict(run_time=args.run_time, interval=args.interval, num_samples=args.samples,
+                        show_equation=args.equation, fit_type=args.fit, wavelength=args.wavelength,
+                        jobs=args.jobs, plotly_js=args.plotly_js, plots=args.plots, dtype=args.dtype,
+                        force=args.force, per_sample_peak=args.per_sample_peak, bundle=args.bundle,
+                        max_traces=args.max_traces, spectra_style=args.spectra_style, **replicate_settings(args))
+
+        csv_files = expand_inputs(args.inputs)
+        failed = process_files(csv_files, settings, args.output, args.cache)
+        if csv_files:
+            print(f"Processed {len(csv_files) - len(failed)} of {len(csv_files)} file(s).")
+        for csv_file in failed:
+            print(f"- failed: {csv_file}")
+
+        # Keep the interpreter (and its imported libraries) warm for the files still to come
+        if args.watch:
+            watch_directory(args.watch, settings, args.output, args.poll, args.cache)
+
+        return 1 if failed else 0
+    finally:
+        # Every file is written before the programme ends, even after an error or Ctrl+C
+        for path, error in stop_writer():
+            print(f"Error writing {path}: {error}")
 
 # ----- Running the programme -------------------
 if __name__ == "__main__":
-    main()
+    sys.exit(main())
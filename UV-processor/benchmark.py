@@ -0,0 +1,366 @@
+"""
+Author: Ryan Neville Hansen | Stellenbosch University
+Email: 25088521@sun.ac.za
+
+Benchmarks for UV-processor.py.
+
+    python benchmark.py importtime              Start-up and import times of each pipeline mode
+    python benchmark.py generate FILE           Write a synthetic export of any size
+    python benchmark.py pipeline --size plate96 Time and memory of each pipeline stage
+    python benchmark.py pipeline --baseline benchmark_results/pipeline_plate96.json
+                                                The same, failing if a stage got slower
+
+Results are printed and saved as JSON in the benchmark_results folder, so runs before and
+after a change can be compared.
+"""
+
+# ----- Importing libraries -------------------------------------------------------------------------
+
+import io
+import os
+import re
+import sys
+import json
+import shutil
+import argparse
+import platform
+import tempfile
+import subprocess
+import time
+import tracemalloc
+import importlib.util
+from contextlib import redirect_stdout
+
+import numpy as np
+
+# ----- Global variables -------------------------------------------------------------------------
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+UV_PROCESSOR = os.path.join(SCRIPT_DIR, 'UV-processor.py')
+SAMPLE_CSV = os.path.join(SCRIPT_DIR, 'Export_Data_Group_2.csv')
+RESULTS_DIR = os.path.join(SCRIPT_DIR, 'benchmark_results')
+
+# Settings matching the bundled sample export
+SAMPLE_SETTINGS = ['--run-time', '1200', '--interval', '10']
+
+# The libraries whose import cost we track
+HEAVY_PACKAGES = ['numpy', 'pandas', 'scipy', 'matplotlib', 'plotly']
+
+# Command line arguments for each pipeline mode; None means the sample CSV is not processed
+IMPORTTIME_MODES = {
+    'startup': (['--help'], None),
+    'csv-only': (SAMPLE_SETTINGS + ['--no-plots'], SAMPLE_CSV),
+    'full': (SAMPLE_SETTINGS, SAMPLE_CSV),
+}
+
+# Synthetic exports: (samples, cycles, wavelengths). plate384 is the largest plate we run,
+# an export of about 5 GB that needs about 2 GB of memory as float64 (1 GB with --float32)
+EXPORT_SIZES = {
+    'sample': (7, 121, 301),
+    'plate96': (96, 121, 301),
+    'long-run': (24, 1000, 301),
+    'plate384': (384, 1000, 600),
+}
+
+# Time between readings of the synthetic exports, in seconds
+EXPORT_INTERVAL = 10
+
+# The stages timed by the pipeline benchmark, in the order they run
+PIPELINE_STAGES = ['process_uv_data', 'normalize_data', 'plot_absorbance_data', 'determine_rate']
+
+# ----- Utility functions -------------------------------------------------------------------------
+
+def environment() -> dict:
+    # Describe the machine, so results from different machines are not compared by mistake
+    return {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'processor': platform.processor() or platform.machine(),
+        'cpu_count': os.cpu_count(),
+        'date': time.strftime('%Y-%m-%d %H:%M:%S'),
+    }
+
+def save_results(name, results) -> str:
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    results_file = os.path.join(RESULTS_DIR, f'{name}.json')
+    with open(results_file, 'w') as f:
+        json.dump(results, f, indent=2)
+    return results_file
+
+def parse_importtime(stderr) -> dict:
+    """Total import time and the time of each tracked package, in seconds, from `-X importtime` output."""
+    packages = dict.fromkeys(HEAVY_PACKAGES, 0.0)
+    loaded = set()
+    total = 0.0
+    for line in stderr.splitlines():
+        match = re.match(r'import time:\s+(\d+) \|\s+(\d+) \|( +)(\S+)', line)
+        if not match:
+            continue
+        cumulative = int(match.group(2)) / 1e6
+        level = (len(match.group(3)) - 1) // 2
+        root = match.group(4).split('.')[0]
+        if root in packages:
+            loaded.add(root)
+
+        # Top level imports include everything they import themselves
+        if level == 0:
+            total += cumulative
+            if root in packages:
+                packages[root] += cumulative
+
+    return {
+        'import_time_s': round(total, 4),
+        'packages_s': {name: round(seconds, 4) for name, seconds in packages.items()},
+        'loaded': sorted(loaded),
+    }
+
+def load_uv_processor():
+    # UV-processor.py cannot be imported by name because of the '-'
+    spec = importlib.util.spec_from_file_location('uv_processor', UV_PROCESSOR)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules['uv_processor'] = module
+    spec.loader.exec_module(module)
+    return module
+
+# ----- Synthetic exports -------------------------------------------------------------------------
+
+def write_export(path, samples, cycles, wavelengths, seed=0) -> None:
+    """
+    Write a synthetic export in the layout of the plate reader: a header row of sample names
+    (name, then name_C1, name_C2, ... for each later cycle) and a row of 'Wavelength (nm),Abs'
+    pairs, then one row per wavelength holding a (wavelength, absorbance) pair per sample and cycle.
+
+    Every sample has an absorbance peak near 595 nm that rises as 1 - exp(-bt), with its own
+    amplitude and rate, on a sloping baseline with noise; a tenth of the samples are flat controls.
+    Wavelengths run down from 700 nm in steps of 1 nm.
+    The file is written one row at a time, so exports larger than memory can be made.
+    """
+    rng = np.random.default_rng(seed)
+    names = [f'S{i + 1}_{"neg_control" if i % 10 == 9 else f"{(i % 8 + 1) * 3}_uM"}' for i in range(samples)]
+    wavelength_values = np.arange(700, 700 - wavelengths, -1)
+
+    # Kinetics of every sample over the cycles, shape (samples, cycles)
+    times = np.arange(cycles) * EXPORT_INTERVAL
+    amplitude = rng.uniform(0.4, 1.2, samples)
+    rate = rng.uniform(0.5, 5, samples) / max(times[-1], 1)
+    amplitude[9::10] = 0
+    kinetics = amplitude[:, None] * (1 - np.exp(-rate[:, None] * times[None, :]))
+    offset = rng.normal(0, 0.02, samples)[:, None]
+
+    # Like the real readings, the noise is shared by all wavelengths of one reading, so every
+    # spectrum stays smooth and has a single peak, with a little extra noise per value
+    reading_noise = rng.normal(0, 0.005, (samples, cycles))
+
+    with open(path, 'w', newline='') as f:
+        header = [name if cycle == 0 else f'{name}_C{cycle}' for cycle in range(cycles) for name in names]
+        f.write(',,'.join(header) + ',\n')
+        f.write(','.join(['Wavelength (nm),Abs'] * (samples * cycles)) + '\n')
+
+        # Each row interleaves (wavelength, absorbance) for cycle 0 of every sample, then cycle 1, ...
+        row = np.empty((cycles, samples, 2))
+        for wavelength in wavelength_values:
+            peak = np.exp(-((wavelength - 595) / 60) ** 2)
+            baseline = 0.1 + 0.3 * (700 - wavelength) / 500
+            absorbance = peak * kinetics + baseline + offset + reading_noise + rng.normal(0, 1e-5, (samples, cycles))
+            row[:, :, 0] = wavelength
+            row[:, :, 1] = absorbance.T
+            row.tofile(f, sep=',', format='%.6g')
+            f.write('\n')
+
+def synthetic_export(size, export_dir=None) -> str:
+    # Exports are kept in the temp folder and reused, as the large ones take a while to write
+    samples, cycles, wavelengths = EXPORT_SIZES[size]
+    export_dir = export_dir or os.path.join(tempfile.gettempdir(), 'uvp-benchmark-exports')
+    export_file = os.path.join(export_dir, f'{size}_{samples}x{cycles}x{wavelengths}.csv')
+    if not os.path.exists(export_file):
+        os.makedirs(export_dir, exist_ok=True)
+        print(f"Writing a {samples} samples x {cycles} cycles x {wavelengths} wavelengths export to {export_file}...")
+        write_export(export_file + '.tmp', samples, cycles, wavelengths)
+        os.replace(export_file + '.tmp', export_file)
+    return export_file
+
+# ----- Benchmarks -------------------------------------------------------------------------------
+
+def benchmark_importtime(repeat=3) -> dict:
+    # Run each mode in a fresh interpreter, keeping the fastest of the repeats
+    results = {'environment': environment(), 'modes': {}}
+    for mode, (arguments, csv_file) in IMPORTTIME_MODES.items():
+        best = None
+        for _ in range(repeat):
+            with tempfile.TemporaryDirectory() as work_dir:
+                command = [sys.executable, '-X', 'importtime', UV_PROCESSOR] + arguments
+                if csv_file:
+                    shutil.copy(csv_file, work_dir)
+                    command += ['--output', os.path.join(work_dir, 'output'),
+                                os.path.join(work_dir, os.path.basename(csv_file))]
+
+                start = time.perf_counter()
+                completed = subprocess.run(command, capture_output=True, text=True,
+                                           env=dict(os.environ, MPLBACKEND='Agg'))
+                wall_time = time.perf_counter() - start
+                if completed.returncode != 0:
+                    raise RuntimeError(f"'{mode}' failed:\n{completed.stderr[-2000:]}")
+
+            run = parse_importtime(completed.stderr)
+            run['wall_time_s'] = round(wall_time, 4)
+            if best is None or run['wall_time_s'] < best['wall_time_s']:
+                best = run
+        results['modes'][mode] = best
+
+        print(f"{mode:<10} wall {best['wall_time_s']:7.3f} s   imports {best['import_time_s']:7.3f} s   "
+              f"loaded: {', '.join(best['loaded'])}")
+    return results
+
+def run_stage(function, *args, memory=False, **kwargs):
+    """Run one pipeline stage quietly, returning its result, time in seconds and (with memory) the
+    peak memory it allocated on top of what already existed, in MB."""
+    if memory:
+        tracemalloc.start()
+    start = time.perf_counter()
+    with redirect_stdout(io.StringIO()):
+        result = function(*args, **kwargs)
+    elapsed = time.perf_counter() - start
+    peak = None
+    if memory:
+        peak = tracemalloc.get_traced_memory()[1] / 1e6
+        tracemalloc.stop()
+    return result, elapsed, peak
+
+def run_pipeline_stages(uvp, csv_file, cycles, plots=True, memory=False, dtype=np.float64) -> dict:
+    # The stages as run_pipeline runs them, without the cache, each into a fresh output folder
+    stages = {}
+    with tempfile.TemporaryDirectory() as work_dir:
+        output_root = os.path.join(work_dir, 'output')
+        uvp.create_output_dirs(output_root, plots)
+        run_time = (cycles - 1) * EXPORT_INTERVAL
+
+        processed, stages['process_uv_data'], peak = run_stage(
+            uvp.process_uv_data, csv_file, run_time, EXPORT_INTERVAL, output_root=output_root, dtype=dtype, memory=memory)
+        stages['process_uv_data_mb'] = peak
+        normalised, stages['normalize_data'], stages['normalize_data_mb'] = run_stage(
+            uvp.normalize_data, processed, output_root=output_root, dtype=dtype, memory=memory)
+        if plots:
+            _, stages['plot_absorbance_data'], stages['plot_absorbance_data_mb'] = run_stage(
+                uvp.plot_absorbance_data, normalised, output_root=output_root, memory=memory)
+        _, stages['determine_rate'], stages['determine_rate_mb'] = run_stage(
+            uvp.determine_rate, normalised, output_root=output_root, wavelength=0, plots=plots, memory=memory)
+    return stages
+
+def benchmark_pipeline(size, repeat=1, plots=True, memory=True, dtype=np.float64) -> dict:
+    """Time each stage (the fastest of the repeats), then measure its peak memory in one more run
+    under tracemalloc, which would slow down the timed runs."""
+    import matplotlib
+    matplotlib.use('Agg')
+    uvp = load_uv_processor()
+
+    # Import the libraries the stages import lazily, so their import time is not counted
+    # (benchmark.py importtime measures that)
+    import pandas, scipy.optimize, scipy.signal, matplotlib.pyplot, plotly.graph_objects
+    csv_file = synthetic_export(size)
+    samples, cycles, wavelengths = EXPORT_SIZES[size]
+
+    times = {}
+    for _ in range(repeat):
+        for stage, seconds in run_pipeline_stages(uvp, csv_file, cycles, plots, dtype=dtype).items():
+            if not stage.endswith('_mb'):
+                times[stage] = min(times.get(stage, seconds), seconds)
+    peaks = {}
+    if memory:
+        peaks = {stage[:-3]: mb for stage, mb in run_pipeline_stages(uvp, csv_file, cycles, plots, True, dtype).items()
+                 if stage.endswith('_mb')}
+
+    results = {'environment': environment(), 'size': size, 'samples': samples, 'cycles': cycles,
+               'wavelengths': wavelengths, 'dtype': np.dtype(dtype).name, 'stages': {}}
+    for stage in PIPELINE_STAGES:
+        if stage in times:
+            results['stages'][stage] = {'time_s': round(times[stage], 4),
+                                        'peak_mb': round(peaks[stage], 1) if stage in peaks else None}
+            peak = f"{peaks[stage]:9.1f} MB" if stage in peaks else ''
+            print(f"{stage:<22} {times[stage]:9.3f} s {peak}")
+    return results
+
+def compare_pipeline(results, baseline, tolerance=0.25) -> list:
+    """Print each stage against the baseline and return the stages that got slower or use more
+    memory by more than the tolerance (0.25 is 25%)."""
+    if (baseline['samples'], baseline['cycles'], baseline['wavelengths']) != \
+            (results['samples'], results['cycles'], results['wavelengths']):
+        print("Warning: the baseline was measured on an export of another size.")
+    if baseline['environment']['platform'] != results['environment']['platform']:
+        print("Warning: the baseline was measured on another machine.")
+
+    regressions = []
+    print(f"\nCompared with {baseline['environment']['date']} (regression above {tolerance:.0%}):")
+    for stage, new in results['stages'].items():
+        old = baseline['stages'].get(stage)
+        if not old:
+            continue
+        for key, unit in (('time_s', 's'), ('peak_mb', 'MB')):
+            if old.get(key) and new.get(key) is not None:
+                change = new[key] / old[key] - 1
+                flag = ''
+                if change > tolerance:
+                    flag = '  <-- regression'
+                    regressions.append(f'{stage} {key}')
+                print(f"{stage:<22} {key:<8} {old[key]:10.3f} -> {new[key]:10.3f} {unit:<2} ({change:+7.1%}){flag}")
+    return regressions
+
+# ----- Main method -------------------------------------------------------------------------------------
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmarks for UV-processor.py')
+    subparsers = parser.add_subparsers(dest='benchmark', required=True)
+
+    importtime_parser = subparsers.add_parser('importtime', help='start-up and import times of each pipeline mode')
+    importtime_parser.add_argument('--repeat', type=int, default=3, help='runs per mode, the fastest is kept (default: 3)')
+
+    generate_parser = subparsers.add_parser('generate', help='write a synthetic export')
+    generate_parser.add_argument('output', help='CSV file to write')
+    generate_parser.add_argument('--size', choices=EXPORT_SIZES, default='plate96',
+                                 help='preset size (default: plate96); ' +
+                                      ', '.join(f'{name}: {s} samples x {c} cycles x {w} wavelengths'
+                                                for name, (s, c, w) in EXPORT_SIZES.items()))
+    generate_parser.add_argument('--samples', type=int, help='number of samples, instead of the preset')
+    generate_parser.add_argument('--cycles', type=int, help='number of cycles (readings), instead of the preset')
+    generate_parser.add_argument('--wavelengths', type=int, help='number of wavelengths, instead of the preset')
+    generate_parser.add_argument('--seed', type=int, default=0, help='random seed (default: 0)')
+
+    pipeline_parser = subparsers.add_parser('pipeline', help='time and memory of each pipeline stage')
+    pipeline_parser.add_argument('--size', choices=EXPORT_SIZES, default='plate96',
+                                 help='synthetic export to process (default: plate96)')
+    pipeline_parser.add_argument('--repeat', type=int, default=1, help='timed runs, the fastest is kept (default: 1)')
+    pipeline_parser.add_argument('--no-plots', dest='plots', action='store_false', help='skip the plots')
+    pipeline_parser.add_argument('--no-memory', dest='memory', action='store_false',
+                                 help='skip the tracemalloc run that measures the peak memory of each stage')
+    pipeline_parser.add_argument('--float32', dest='dtype', action='store_const', const=np.float32, default=np.float64,
+                                 help='process the data as 32-bit floats')
+    pipeline_parser.add_argument('--baseline', help='earlier results to compare with; exits with 1 on a regression')
+    pipeline_parser.add_argument('--tolerance', type=float, default=0.25,
+                                 help='allowed increase in time or memory before it counts as a regression (default: 0.25)')
+    pipeline_parser.add_argument('--name', help="name of the results file (default: 'pipeline_<size>')")
+
+    args = parser.parse_args(argv)
+
+    if args.benchmark == 'importtime':
+        results = benchmark_importtime(args.repeat)
+        print(f"\nSaved results to {save_results('importtime', results)}")
+
+    elif args.benchmark == 'generate':
+        samples, cycles, wavelengths = EXPORT_SIZES[args.size]
+        write_export(args.output, args.samples or samples, args.cycles or cycles, args.wavelengths or wavelengths,
+                     args.seed)
+        print(f"Wrote {args.output}")
+
+    elif args.benchmark == 'pipeline':
+        results = benchmark_pipeline(args.size, args.repeat, args.plots, args.memory, args.dtype)
+        print(f"\nSaved results to {save_results(args.name or f'pipeline_{args.size}', results)}")
+        if args.baseline:
+            with open(args.baseline) as f:
+                regressions = compare_pipeline(results, json.load(f), args.tolerance)
+            if regressions:
+                print(f"\nRegressions: {', '.join(regressions)}")
+                return 1
+    return 0
+
+# ----- Running the programme -------------------
+if __name__ == "__main__":
+    sys.exit(main())
@@ -8,7 +8,8 @@ REM Now, run the Python script using its full path.
 REM CRUCIALLY: We do *not* use pushd/popd here. This means the
 REM current working directory of the command prompt will remain
 REM whatever directory you were in when you typed 'UVP'.
-python "%PYTHON_SCRIPT_FULL_PATH%"
+REM Any arguments (e.g. UVP --run-time 600 --interval 10 *.csv) are passed on.
+python "%PYTHON_SCRIPT_FULL_PATH%" %*
 
 REM Optional: Keep the command prompt window open after the script finishes
 REM PAUSE
\ No newline at end of file
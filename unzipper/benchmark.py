@@ -0,0 +1,213 @@
+# Author: Ryan Neville Hansen | Stellenbosch University
+# Email: 25088521@sun.ac.za
+#
+# Benchmark for unzipper.py on a synthetic corpus of archives:
+#
+#     python benchmark.py                        Generate the corpus (once) and time the extraction
+#     python benchmark.py --compare old.json     Also show the change against earlier results
+#
+# Results are printed and saved as JSON in the benchmark_results folder, so runs before and after a
+# change to the extractor can be compared.
+
+# ----- Imports -----------------------------------------------------------------------------------
+import os
+import io
+import sys
+import json
+import time
+import random
+import shutil
+import zipfile
+import argparse
+import platform
+import tempfile
+import subprocess
+
+# ----- Global variables --------------------------------------------------------------------------
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+UNZIPPER = os.path.join(SCRIPT_DIR, 'unzipper.py')
+RESULTS_DIR = os.path.join(SCRIPT_DIR, 'benchmark_results')
+CORPUS_VERSION = 1
+
+# ----- Corpus ------------------------------------------------------------------------------------
+def text_block(rng, size):
+    """Instrument-like text (numbers in CSV rows), which deflate compresses about 3 to 4 times."""
+    rows = []
+    length = 0
+    while length < size:
+        row = ','.join(f'{rng.random() * 2:.6f}' for _ in range(8)) + '\n'
+        rows.append(row)
+        length += len(row)
+    return ''.join(rows)[:size].encode()
+
+def nested_zip(rng, depth, width, files):
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_DEFLATED) as archive:
+        for i in range(files):
+            archive.writestr(f'data/reading_{i}.csv', text_block(rng, 20_000))
+        if depth > 0:
+            for i in range(width):
+                archive.writestr(f'runs/run_{i}.zip', nested_zip(rng, depth - 1, width, files))
+    return buffer.getvalue()
+
+def make_corpus(corpus_dir, scale=1.0):
+    """Write the four kinds of archive the extractor has to deal with, each in its own folder."""
+    rng = random.Random(0)
+    os.makedirs(corpus_dir, exist_ok=True)
+
+    # flat: one archive of medium-sized files
+    os.makedirs(os.path.join(corpus_dir, 'flat'), exist_ok=True)
+    with zipfile.ZipFile(os.path.join(corpus_dir, 'flat', 'flat.zip'), 'w', zipfile.ZIP_DEFLATED) as archive:
+        block = text_block(rng, 200_000)
+        for i in range(int(500 * scale)):
+            offset = rng.randrange(100_000)
+            archive.writestr(f'plate_{i // 50}/well_{i}.csv', block[offset:offset + 100_000])
+
+    # nested: archives inside archives, four levels deep
+    os.makedirs(os.path.join(corpus_dir, 'nested'), exist_ok=True)
+    for i in range(max(1, int(2 * scale))):
+        with open(os.path.join(corpus_dir, 'nested', f'dump_{i}.zip'), 'wb') as f:
+            f.write(nested_zip(rng, 4, 3, 2))
+
+    # many-small: tens of thousands of tiny files, where file system overhead dominates
+    os.makedirs(os.path.join(corpus_dir, 'many-small'), exist_ok=True)
+    with zipfile.ZipFile(os.path.join(corpus_dir, 'many-small', 'small.zip'), 'w', zipfile.ZIP_DEFLATED) as archive:
+        block = text_block(rng, 10_000)
+        for i in range(int(20_000 * scale)):
+            offset = rng.randrange(9_500)
+            archive.writestr(f'{i // 1000}/{i}.txt', block[offset:offset + 500])
+
+    # few-huge: a handful of large files, where decompression dominates
+    os.makedirs(os.path.join(corpus_dir, 'few-huge'), exist_ok=True)
+    with zipfile.ZipFile(os.path.join(corpus_dir, 'few-huge', 'huge.zip'), 'w', zipfile.ZIP_DEFLATED) as archive:
+        block = text_block(rng, 4 * 1024 * 1024)
+        for i in range(3):
+            with archive.open(f'raw_{i}.csv', 'w', force_zip64=True) as member:
+                for _ in range(int(16 * scale)):
+                    member.write(block)
+
+    with open(os.path.join(corpus_dir, 'corpus.json'), 'w') as f:
+        json.dump({'version': CORPUS_VERSION, 'scale': scale}, f)
+
+def corpus_ready(corpus_dir, scale):
+    try:
+        with open(os.path.join(corpus_dir, 'corpus.json')) as f:
+            return json.load(f) == {'version': CORPUS_VERSION, 'scale': scale}
+    except (OSError, ValueError):
+        return False
+
+# ----- Utility functions -------------------------------------------------------------------------
+def environment():
+    # Describe the machine, so results from different machines are not compared by mistake
+    return {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'processor': platform.processor() or platform.machine(),
+        'cpu_count': os.cpu_count(),
+        'date': time.strftime('%Y-%m-%d %H:%M:%S'),
+    }
+
+def save_results(name, results):
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    results_file = os.path.join(RESULTS_DIR, f'{name}.json')
+    with open(results_file, 'w') as f:
+        json.dump(results, f, indent=2)
+    return results_file
+
+def run_unzipper(folder, dest, extra_args=()):
+    """Run unzipper.py on a folder and return the totals of its --stats-json report."""
+    stats_file = os.path.join(dest, 'stats.json')
+    os.makedirs(dest, exist_ok=True)
+    command = [sys.executable, UNZIPPER, folder, '--keep', '--dest', os.path.join(dest, 'out'),
+               '--stats-json', stats_file] + list(extra_args)
+    completed = subprocess.run(command, capture_output=True, text=True, stdin=subprocess.DEVNULL)
+    if completed.returncode != 0:
+        raise RuntimeError(f"unzipper.py failed on {folder}:\n{completed.stdout[-2000:]}{completed.stderr[-2000:]}")
+    with open(stats_file) as f:
+        return json.load(f)['totals']
+
+def extractall_time(folder, dest):
+    """Time of the plain zipfile.extractall, as a reference (nested archives are not extracted)."""
+    start = time.perf_counter()
+    for root, _, names in os.walk(folder):
+        for name in sorted(names):
+            if name.endswith('.zip'):
+                with zipfile.ZipFile(os.path.join(root, name)) as archive:
+                    archive.extractall(os.path.join(dest, os.path.splitext(name)[0]))
+    return time.perf_counter() - start
+
+# ----- Benchmark ---------------------------------------------------------------------------------
+def benchmark_extract(corpus_dir, repeat=3):
+    """Extract each kind of archive from scratch and again into the same folder (incremental), keeping
+    the fastest of the repeats."""
+    results = {'environment': environment(), 'corpus': {}}
+    for kind in sorted(os.listdir(corpus_dir)):
+        folder = os.path.join(corpus_dir, kind)
+        if not os.path.isdir(folder):
+            continue
+
+        best = {}
+        for _ in range(repeat):
+            work_dir = tempfile.mkdtemp(prefix='unzipper-benchmark-')
+            try:
+                runs = {
+                    'extractall_s': extractall_time(folder, os.path.join(work_dir, 'reference')),
+                    'fresh': run_unzipper(folder, work_dir),
+                    'unchanged': run_unzipper(folder, work_dir),
+                }
+            finally:
+                shutil.rmtree(work_dir, ignore_errors=True)
+
+            for mode in ('fresh', 'unchanged'):
+                if mode not in best or runs[mode]['wall_s'] < best[mode]['wall_s']:
+                    best[mode] = runs[mode]
+            best['extractall_s'] = min(best.get('extractall_s', float('inf')), runs['extractall_s'])
+        results['corpus'][kind] = best
+
+        fresh = best['fresh']
+        print(f"{kind:<11} {fresh['archives']:>4} archives {fresh['members']:>7} members {fresh['bytes_out'] / 1e6:>8.1f} MB   "
+              f"fresh {fresh['wall_s']:7.3f} s ({fresh['mb_out_per_s']:6.1f} MB/s)   "
+              f"unchanged {best['unchanged']['wall_s']:7.3f} s   extractall {best['extractall_s']:7.3f} s")
+    return results
+
+def compare(results, old_results):
+    # Positive percentages are slower than before
+    print(f"\nCompared with {old_results['environment']['date']} ({old_results['environment']['platform']}):")
+    for kind, runs in results['corpus'].items():
+        old_runs = old_results['corpus'].get(kind)
+        if not old_runs:
+            continue
+        changes = []
+        for mode in ('fresh', 'unchanged'):
+            old_time, new_time = old_runs[mode]['wall_s'], runs[mode]['wall_s']
+            changes.append(f"{mode} {old_time:7.3f} -> {new_time:7.3f} s ({(new_time / old_time - 1) * 100:+6.1f}%)")
+        print(f"{kind:<11} " + '   '.join(changes))
+
+# ----- Main method -------------------------------------------------------------------------------
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark for unzipper.py')
+    parser.add_argument('--corpus', default=os.path.join(tempfile.gettempdir(), 'unzipper-benchmark-corpus'),
+                        help='folder for the generated archives, reused between runs (default: in the temp folder)')
+    parser.add_argument('--scale', type=float, default=1.0,
+                        help='size of the corpus; 1 is about 250 MB extracted (default: 1)')
+    parser.add_argument('--repeat', type=int, default=3, help='runs per kind of archive, the fastest is kept (default: 3)')
+    parser.add_argument('--compare', metavar='JSON', help='earlier results to compare with')
+    parser.add_argument('--name', default='extract', help="name of the results file (default: 'extract')")
+    args = parser.parse_args(argv)
+
+    if not corpus_ready(args.corpus, args.scale):
+        print(f"Generating the corpus in {args.corpus}...")
+        shutil.rmtree(args.corpus, ignore_errors=True)
+        make_corpus(args.corpus, args.scale)
+
+    results = benchmark_extract(args.corpus, args.repeat)
+    results['scale'] = args.scale
+    print(f"\nSaved results to {save_results(args.name, results)}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            compare(results, json.load(f))
+
+# ----- Running the programme -------------------
+if __name__ == "__main__":
+    main()
@@ -4,82 +4,672 @@
 
 # ----- Imports -----------------------------------------------------------------------------------
 import zipfile
+import tarfile
 from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from functools import partial
 import os
 import sys
+import bz2
+import gzip
+import json
+import lzma
+import argparse
+import time
+import zlib
+import threading
+
+# ----- Global variables --------------------------------------------------------------------------
+# Archives are extracted in threads: zlib and file I/O release the GIL, so independent archives
+# are decompressed in parallel without the cost of starting processes
+WORKERS = min(32, (os.cpu_count() or 1) + 4)
+
+# Nested archives deeper than this are left as they are, which also stops zip bombs that
+# contain themselves
+MAX_DEPTH = 10
+
+# Members of one large archive are also split over threads, each with its own handle on the file.
+# Small archives are extracted in a single thread, where starting more would cost more than it saves.
+# The member threads are shared by all archives extracted at the same time (see reserve_member_threads).
+MEMBER_WORKERS = os.cpu_count() or 1
+PARALLEL_MIN_MEMBERS = 64
+PARALLEL_MIN_BYTES = 64 * 1024 * 1024
+
+# Members are copied to disk in blocks of this size, so large files never sit in memory whole
+COPY_BUFFER = 1024 * 1024
+
+# Each extracted folder keeps a list of the members written into it, so extracting the same archive
+# again only writes the members that are new or changed
+MANIFEST_NAME = '.unzipper-manifest.json'
+
+# Member threads currently running, over all archives
+_member_threads = 0
+_member_threads_lock = threading.Lock()
+
+# Extensions stripped from an archive's name to get the folder it is extracted to, longest first.
+# Only used for naming and for finding archives in folders: the format itself is recognised
+# from the file contents (see BACKENDS)
+ARCHIVE_SUFFIXES = ['.tar.gz', '.tar.bz2', '.tar.xz', '.tar.zst', '.tgz', '.tbz2', '.tbz', '.txz', '.tzst',
+                    '.tar', '.zip', '.7z']
+
+# Single compressed files; extracted when named directly, but not searched for in folders
+COMPRESSED_SUFFIXES = ['.gz', '.bz2', '.xz', '.zst']
+
+# Keeps messages from different threads on their own lines
+print_lock = threading.Lock()
 
 # ----- Utility functions -------------------------------------------------------------------------
-def extract_zip(zip_path):
-    """Extract a single ZIP file to a folder with the same name."""
+def log(message):
+    """Print a message from any thread."""
+    with print_lock:
+        print(message, flush=True)
+
+def member_target(extract_path, name):
+    """Path a member is extracted to, dropping drive letters, absolute paths and '..' like ZipFile.extractall."""
+    name = name.replace('/', os.path.sep)
+    if os.path.altsep:
+        name = name.replace(os.path.altsep, os.path.sep)
+    name = os.path.splitdrive(name)[1]
+    parts = [part for part in name.split(os.path.sep) if part not in ('', '.', '..')]
+    if os.path.sep == '\\':
+        # Characters Windows does not allow in file names
+        parts = [part.translate(str.maketrans(':<>|"?*', '_______')).rstrip('.') for part in parts]
+        parts = [part for part in parts if part]
+    return Path(extract_path, *parts)
+
+def archive_stem(archive_path):
+    """Name of the folder an archive is extracted to: its name without the archive extension(s)."""
+    name = Path(archive_path).name
+    for suffix in ARCHIVE_SUFFIXES + COMPRESSED_SUFFIXES:
+        if name.lower().endswith(suffix) and len(name) > len(suffix):
+            return name[:-len(suffix)]
+    return Path(archive_path).stem
+
+def is_archive_name(name):
+    """Whether a file found in a folder or inside another archive should be extracted as well."""
+    return any(name.lower().endswith(suffix) for suffix in ARCHIVE_SUFFIXES)
+
+def member_mtime(info):
+    """Modification time stored in the archive for a member, as a timestamp."""
+    return time.mktime(info.date_time + (0, 0, -1))
+
+def write_members(archive, members):
+    """Stream the given (info, target) members of an open archive to disk. Returns the time spent
+    reading (and decompressing) the members, and the time spent on everything else: creating,
+    writing and closing the files."""
+    timings = {'read_s': 0.0, 'write_s': 0.0}
+    for info, target in members:
+        start = time.perf_counter()
+        read_time = 0.0
+        with archive.open(info) as source, open(target, 'wb') as destination:
+            # As shutil.copyfileobj, but timing the reads
+            while True:
+                read_start = time.perf_counter()
+                chunk = source.read(COPY_BUFFER)
+                read_time += time.perf_counter() - read_start
+                if not chunk:
+                    break
+                destination.write(chunk)
+
+        # Keep the time from the archive, which lets a later run recognise the file without reading it
+        try:
+            os.utime(target, (member_mtime(info), member_mtime(info)))
+        except (OSError, OverflowError, ValueError):
+            pass
+        timings['read_s'] += read_time
+        timings['write_s'] += time.perf_counter() - start - read_time
+    return timings
+
+def write_members_from(zip_path, members):
+    """Open the archive separately, so several threads can read it at the same time."""
+    with zipfile.ZipFile(zip_path, 'r') as archive:
+        return write_members(archive, members)
+
+def reserve_member_threads(wanted, limit):
+    """Take up to wanted member threads from a budget of limit shared by all archives being extracted,
+    so several large archives at once do not each start a thread (and open a file) per core. Returns
+    the number taken, possibly 0, which is given back with release_member_threads."""
+    global _member_threads
+    with _member_threads_lock:
+        reserved = max(0, min(wanted, limit - _member_threads))
+        _member_threads += reserved
+    return reserved
+
+def release_member_threads(reserved):
+    global _member_threads
+    with _member_threads_lock:
+        _member_threads -= reserved
+
+def load_manifest(extract_path):
+    try:
+        with open(Path(extract_path, MANIFEST_NAME)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def save_manifest(extract_path, manifest):
+    manifest_file = Path(extract_path, MANIFEST_NAME)
+    temp_file = manifest_file.with_name(manifest_file.name + '.tmp')
+    with open(temp_file, 'w') as f:
+        f.write(json.dumps(manifest, separators=(',', ':')))
+    os.replace(temp_file, manifest_file)
+
+def member_signature(info):
+    # What the central directory says about a member: size, CRC32 and modification time
+    return [info.file_size, info.CRC, list(info.date_time)]
+
+def mark_deleted(extract_path, archive_paths):
+    """Record in the manifest of extract_path that these nested archives were deleted after they were
+    extracted, so the next run does not write them again only to extract and delete them once more."""
+    archive_paths = {Path(f) for f in archive_paths}
+    manifest = load_manifest(extract_path)
+    for name, recorded in manifest.items():
+        if len(recorded) == 3 and member_target(extract_path, name) in archive_paths:
+            manifest[name] = recorded + ['deleted']
+    if manifest:
+        save_manifest(extract_path, manifest)
+
+def file_crc(path):
+    crc = 0
+    with open(path, 'rb') as f:
+        while chunk := f.read(COPY_BUFFER):
+            crc = zlib.crc32(chunk, crc)
+    return crc
+
+def is_unchanged(info, target, recorded, folder_names):
+    """Whether the file on disk already holds this member."""
+    # Written by an earlier run: the manifest matches, so only check the file is still there,
+    # which the (cached) listing of its folder answers without touching the file itself
+    if recorded == member_signature(info):
+        if target.parent not in folder_names:
+            try:
+                folder_names[target.parent] = set(os.listdir(target.parent))
+            except OSError:
+                folder_names[target.parent] = set()
+        return target.name in folder_names[target.parent]
+
+    # Otherwise compare with the file itself: same size, and the same time or the same CRC32
+    try:
+        stat = os.stat(target)
+    except OSError:
+        return False
+    if stat.st_size != info.file_size:
+        return False
+    try:
+        if abs(stat.st_mtime - member_mtime(info)) < 1:
+            return True
+    except (OverflowError, ValueError):
+        pass
+    return file_crc(target) == info.CRC
+
+def extract_members(archive, zip_path, extract_path, member_workers=MEMBER_WORKERS, incremental=True):
+    """Extract all members of an open archive, splitting large archives over several threads.
+    When incremental, members already on disk are skipped. Returns the nested archives and the
+    statistics of the extraction."""
+    # When a name appears twice the last one wins, as with extractall
+    files = {}
+    folders = {Path(extract_path)}
+    for info in archive.infolist():
+        target = member_target(extract_path, info.filename)
+        if info.is_dir():
+            folders.add(target)
+        elif target != Path(extract_path):
+            files[target] = info
+            folders.add(target.parent)
+
+    # Create all folders in one pass, before any thread starts writing into them
+    start = time.perf_counter()
+    for folder in sorted(folders):
+        folder.mkdir(parents=True, exist_ok=True)
+    mkdir_time = time.perf_counter() - start
+
+    # Leave out the members that are already on disk
+    start = time.perf_counter()
+    manifest = load_manifest(extract_path) if incremental else {}
+    folder_names = {}
+    members, deleted = [], set()
+    for target, info in files.items():
+        recorded = manifest.get(info.filename)
+        if incremental and recorded == member_signature(info) + ['deleted'] and not target.exists():
+            # A nested archive that an earlier run extracted and deleted, and that has not changed since
+            deleted.add(target)
+        elif not (incremental and is_unchanged(info, target, recorded, folder_names)):
+            members.append((info, target))
+    check_time = time.perf_counter() - start
+
+    total_size = sum(info.file_size for info, _ in members)
+    reserved = 0
+    if member_workers > 1 and (len(members) >= PARALLEL_MIN_MEMBERS or total_size >= PARALLEL_MIN_BYTES):
+        reserved = reserve_member_threads(min(member_workers, len(members)), member_workers)
+    try:
+        # Also in this thread when other archives already use all member threads
+        if reserved <= 1:
+            threads = 1
+            timings = [write_members(archive, members)]
+        else:
+            # Hand out the largest members first, each to the thread with the least work so far
+            groups = [[] for _ in range(reserved)]
+            loads = [0] * len(groups)
+            for info, target in sorted(members, key=lambda member: member[0].compress_size, reverse=True):
+                i = loads.index(min(loads))
+                groups[i].append((info, target))
+                loads[i] += info.compress_size + 1
+            threads = len(groups)
+            with ThreadPoolExecutor(max_workers=threads) as executor:
+                timings = list(executor.map(write_members_from, [zip_path] * len(groups), groups))
+    finally:
+        release_member_threads(reserved)
+
+    # Members are listed by their name in the archive
+    new_manifest = {info.filename: member_signature(info) + (['deleted'] if target in deleted else [])
+                    for target, info in files.items()}
+    if new_manifest != manifest:
+        save_manifest(extract_path, new_manifest)
+
+    # The central directory already lists the nested archives, so there is no need to search for them
+    nested = [target for target in files if is_archive_name(target.name) and target not in deleted]
+
+    # Read and write times are summed over the threads, so with several threads they can exceed the wall time
+    stats = {
+        'members': len(members),
+        'skipped': len(files) - len(members),
+        'bytes_in': sum(info.compress_size for info, _ in members),
+        'bytes_out': total_size,
+        'threads': threads,
+        'mkdir_s': mkdir_time,
+        'check_s': check_time,
+        'read_s': sum(timing['read_s'] for timing in timings),
+        'write_s': sum(timing['write_s'] for timing in timings),
+    }
+    return nested, stats
+
+def extract_zip(zip_path, extract_path, member_workers=MEMBER_WORKERS, incremental=True):
+    """Extract a ZIP file, returning the archives it contained and the statistics of the extraction."""
+    with zipfile.ZipFile(zip_path, 'r') as archive:
+        return extract_members(archive, zip_path, extract_path, member_workers, incremental)
+
+def is_tar_header(block):
+    """Whether a 512 byte block is a tar header: POSIX ones say 'ustar', older ones only have a checksum."""
+    if len(block) < 512:
+        return False
+    if block[257:262] == b'ustar':
+        return True
+    try:
+        checksum = int(block[148:156].strip(b' \0') or b'-1', 8)
+    except ValueError:
+        return False
+    return checksum == sum(block[:148]) + 8 * ord(' ') + sum(block[156:512])
+
+def is_unchanged_file(target, size, mtime):
+    # Tar archives have no checksums, but tarfile keeps the times of the files it extracts
+    try:
+        stat = os.stat(target)
+    except OSError:
+        return False
+    return stat.st_size == size and abs(stat.st_mtime - mtime) < 1
+
+def extract_tar_stream(stream, archive_path, extract_path, incremental=True):
+    """Extract a tar archive from a (decompressed) stream, in a single pass from start to end."""
+    # The 'data' filter refuses links and paths outside the folder, where this Python has it
+    safe = {'filter': 'data'} if hasattr(tarfile, 'data_filter') else {}
+    nested, members, skipped, bytes_out, check_time = [], 0, 0, 0, 0.0
+    start = time.perf_counter()
+    Path(extract_path).mkdir(parents=True, exist_ok=True)
+    with tarfile.open(fileobj=stream, mode='r|') as archive:
+        for member in archive:
+            # Drop absolute paths and '..' from the names, as for ZIP files
+            target = member_target(extract_path, member.name)
+            if target == Path(extract_path):
+                continue
+            member.name = target.relative_to(extract_path).as_posix()
+            if member.isfile():
+                check_start = time.perf_counter()
+                unchanged = incremental and is_unchanged_file(target, member.size, member.mtime)
+                check_time += time.perf_counter() - check_start
+                if is_archive_name(target.name):
+                    nested.append(target)
+                if unchanged:
+                    skipped += 1
+                    continue
+                members += 1
+                bytes_out += member.size
+            archive.extract(member, extract_path, **safe)
+
+    # Reading, decompressing and writing happen in one pass, so they are all counted as reading
+    stats = {
+        'members': members,
+        'skipped': skipped,
+        'bytes_in': os.path.getsize(archive_path),
+        'bytes_out': bytes_out,
+        'threads': 1,
+        'mkdir_s': 0.0,
+        'check_s': check_time,
+        'read_s': time.perf_counter() - start - check_time,
+        'write_s': 0.0,
+    }
+    return nested, stats
+
+def extract_compressed(archive_path, extract_path, member_workers=MEMBER_WORKERS, incremental=True, opener=gzip.open):
+    """Extract a compressed tar archive, or decompress a single compressed file into the folder."""
+    with opener(archive_path) as stream:
+        header = stream.read(512)
+
+    with opener(archive_path) as stream:
+        if is_tar_header(header):
+            return extract_tar_stream(stream, archive_path, extract_path, incremental)
+
+        start = time.perf_counter()
+        Path(extract_path).mkdir(parents=True, exist_ok=True)
+        with open(Path(extract_path, archive_stem(archive_path)), 'wb') as destination:
+            bytes_out = 0
+            while chunk := stream.read(COPY_BUFFER):
+                destination.write(chunk)
+                bytes_out += len(chunk)
+    stats = {'members': 1, 'skipped': 0, 'bytes_in': os.path.getsize(archive_path), 'bytes_out': bytes_out,
+             'threads': 1, 'mkdir_s': 0.0, 'check_s': 0.0, 'read_s': time.perf_counter() - start, 'write_s': 0.0}
+    return [], stats
+
+def open_zstd(archive_path):
+    # Python 3.14 reads zstd itself; before that it needs the zstandard package
+    try:
+        from compression import zstd
+        return zstd.open(archive_path, 'rb')
+    except ImportError:
+        pass
+    try:
+        import zstandard
+    except ImportError:
+        raise RuntimeError("extracting zstd archives needs the 'zstandard' package (pip install zstandard)")
+    return zstandard.ZstdDecompressor().stream_reader(open(archive_path, 'rb'), closefd=True)
+
+def extract_7z(archive_path, extract_path, member_workers=MEMBER_WORKERS, incremental=True):
+    """Extract a 7z archive with py7zr, which is only needed for these."""
     try:
-        with zipfile.ZipFile(zip_path, 'r') as archive:
-            extract_path = Path(zip_path).parent / Path(zip_path).stem
-            archive.extractall(path=extract_path)
-            print(f"Extracted contents from '{os.path.basename(zip_path)}' to '{extract_path}' directory.")
-    except Exception as e:
-        print(f"Error extracting {zip_path}: {str(e)}")
+        import py7zr
+    except ImportError:
+        raise RuntimeError("extracting 7z archives needs the 'py7zr' package (pip install py7zr)")
+
+    start = time.perf_counter()
+    with py7zr.SevenZipFile(archive_path, 'r') as archive:
+        files = [info for info in archive.list() if not info.is_directory]
+        archive.extractall(path=extract_path)
+    nested = [member_target(extract_path, info.filename) for info in files if is_archive_name(info.filename)]
+    stats = {'members': len(files), 'skipped': 0, 'bytes_in': os.path.getsize(archive_path),
+             'bytes_out': sum(info.uncompressed for info in files), 'threads': 1, 'mkdir_s': 0.0, 'check_s': 0.0,
+             'read_s': time.perf_counter() - start, 'write_s': 0.0}
+    return nested, stats
+
+# ----- Archive formats ---------------------------------------------------------------------------
+# Formats are recognised by the magic bytes at the start of the file, not by the extension, and each
+# is extracted by the fastest decoder at hand: zipfile for ZIP files (in parallel for large ones),
+# tarfile reading straight from the stdlib decompressors for tar archives, and the optional
+# zstandard and py7zr packages for zstd and 7z. Each entry is (name, offset, magic bytes, extract function).
+BACKENDS = [
+    ('zip', 0, (b'PK\x03\x04', b'PK\x05\x06'), extract_zip),
+    ('gzip', 0, (b'\x1f\x8b',), partial(extract_compressed, opener=gzip.open)),
+    ('bzip2', 0, (b'BZh',), partial(extract_compressed, opener=bz2.open)),
+    ('xz', 0, (b'\xfd7zXZ\x00',), partial(extract_compressed, opener=lzma.open)),
+    ('zstd', 0, (b'\x28\xb5\x2f\xfd',), partial(extract_compressed, opener=open_zstd)),
+    ('7z', 0, (b"7z\xbc\xaf\x27\x1c",), extract_7z),
+    ('tar', 257, (b'ustar',), partial(extract_compressed, opener=partial(open, mode='rb'))),
+]
+
+def register_backend(name, magic, extract, offset=0):
+    """Add a format, extracted by extract(archive_path, extract_path, member_workers, incremental), which
+    returns the nested archives and the statistics like extract_zip. Later formats are checked first."""
+    BACKENDS.insert(0, (name, offset, (magic,), extract))
+
+def find_backend(archive_path):
+    """The name and extract function for an archive, from its first bytes."""
+    with open(archive_path, 'rb') as f:
+        header = f.read(512)
+    for name, offset, magic, extract in BACKENDS:
+        if header[offset:].startswith(magic):
+            return name, extract
+
+    # Self-extracting ZIP files start with a program, and old tar files have no magic bytes
+    if zipfile.is_zipfile(archive_path):
+        return 'zip', extract_zip
+    if is_tar_header(header):
+        return 'tar', partial(extract_compressed, opener=partial(open, mode='rb'))
+    raise ValueError("not a supported archive (zip, tar, tar.gz/bz2/xz/zst or 7z)")
+
+def extract_archive(archive_path, extract_path=None, member_workers=MEMBER_WORKERS, incremental=True):
+    """Extract a single archive to a folder with the same name (or to extract_path), returning the
+    archives it contained and the statistics of the extraction. Errors are raised, so one bad
+    archive does not stop the others."""
+    start = time.perf_counter()
+    if extract_path is None:
+        extract_path = Path(archive_path).parent / archive_stem(archive_path)
+    name, extract = find_backend(archive_path)
+    nested, stats = extract(archive_path, extract_path, member_workers, incremental)
+    stats = {'archive': str(archive_path), 'format': name, 'wall_s': time.perf_counter() - start, **stats}
+
+    unchanged = f" ({stats['skipped']} unchanged files skipped)" if stats['skipped'] else ""
+    log(f"Extracted contents from '{os.path.basename(archive_path)}' to '{extract_path}' directory.{unchanged}")
+    return nested, stats
+
+def outermost_archives(archive_paths):
+    """The archives that do not lie inside the extracted folder of another archive in the list. The
+    others are usually found again (and rewritten) when that archive is extracted."""
+    archive_paths = [Path(f) for f in archive_paths]
+    extract_folders = {f.resolve().parent / archive_stem(f) for f in archive_paths}
+    return [f for f in archive_paths if not any(folder in extract_folders for folder in f.resolve().parents)]
+
+def find_archives(paths, dest=None, remove=False):
+    """The archives to extract for the given archives and folders, as (archive, extract folder, delete)
+    tuples, and the paths that do not exist. Archives named directly are never deleted, like before;
+    the ones found in folders are deleted when remove is set."""
+    archives, missing = [], []
+    for path in map(Path, paths):
+        if path.is_dir():
+            found = sorted(f for f in path.rglob('*') if is_archive_name(f.name) and f.is_file())
+            for archive_path in found:
+                # With a destination, keep the folder structure below the searched folder
+                extract_path = Path(dest, archive_path.parent.relative_to(path), archive_stem(archive_path)) if dest else None
+                archives.append((archive_path, extract_path, remove))
+        elif path.is_file():
+            archives.append((path, Path(dest, archive_stem(path)) if dest else None, False))
+        else:
+            missing.append(path)
+    return archives, missing
+
+def extract_recursive(archives, remove=False, workers=WORKERS, max_depth=MAX_DEPTH, member_workers=MEMBER_WORKERS,
+                      incremental=True):
+    """Extract the archives from find_archives and every archive found inside them, several archives
+    at a time. Returns the statistics of each archive extracted and the (archive, error) of those that failed."""
+    extracted, failed = [], []
+    # Nested archives deleted after extraction, by the folder their parent was extracted to
+    deleted = {}
+    # Every archive queued, or left out for being nested too deep
+    handled = set()
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        def submit(archive_path, extract_path, delete, depth, parent_path=None):
+            handled.add(Path(archive_path).resolve())
+            if extract_path is None:
+                extract_path = Path(archive_path).parent / archive_stem(archive_path)
+            future = executor.submit(extract_archive, archive_path, extract_path, member_workers, incremental)
+            running[future] = (archive_path, extract_path, delete, depth, parent_path)
+
+        # Archives lying in the folder another archive is extracted to wait until the others are done:
+        # most of them come out of that archive again, and only the rest are extracted afterwards
+        running = {}
+        outermost = set(outermost_archives(archive_path for archive_path, _, _ in archives))
+        deferred = []
+        for archive_path, extract_path, delete in archives:
+            if Path(archive_path) in outermost:
+                submit(archive_path, extract_path, delete, 0)
+            else:
+                deferred.append((archive_path, extract_path, delete))
+
+        # Queue nested archives as soon as their parent is done, instead of searching the folders afterwards
+        while running or deferred:
+            if not running:
+                for archive_path, extract_path, delete in deferred:
+                    if Path(archive_path).resolve() not in handled and os.path.isfile(archive_path):
+                        submit(archive_path, extract_path, delete, 0)
+                deferred = []
+                continue
+
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                archive_path, extract_path, delete, depth, parent_path = running.pop(future)
+                try:
+                    nested, stats = future.result()
+                    start = time.perf_counter()
+                    if delete:
+                        os.remove(archive_path)
+                        log(f"Deleted original archive '{Path(archive_path).name}'.")
+                        if parent_path is not None:
+                            deleted.setdefault(parent_path, []).append(archive_path)
+                    stats['delete_s'] = time.perf_counter() - start
+                except Exception as e:
+                    log(f"Error extracting {archive_path}: {str(e)}")
+                    failed.append((archive_path, str(e)))
+                    continue
+                extracted.append(stats)
+
+                for nested_path in nested:
+                    if depth + 1 > max_depth:
+                        handled.add(Path(nested_path).resolve())
+                        log(f"Not extracting '{nested_path}': archives are nested more than {max_depth} levels deep.")
+                    else:
+                        submit(nested_path, None, remove, depth + 1, extract_path)
+
+    for parent_path, archive_paths in deleted.items():
+        mark_deleted(parent_path, archive_paths)
+    return extracted, failed
+
+def summarise_stats(extracted, wall_time):
+    """Totals over all archives, for --stats."""
+    totals = {key: sum(stats[key] for stats in extracted)
+              for key in ('members', 'skipped', 'bytes_in', 'bytes_out', 'mkdir_s', 'check_s', 'read_s',
+                          'write_s', 'delete_s')}
+    totals['archives'] = len(extracted)
+    totals['wall_s'] = wall_time
+    totals['members_per_s'] = totals['members'] / wall_time if wall_time else 0.0
+    totals['mb_out_per_s'] = totals['bytes_out'] / 1e6 / wall_time if wall_time else 0.0
+    return totals
+
+def print_stats(extracted, totals):
+    print()
+    print(f"{'Archive':<40} {'Members':>8} {'MB in':>9} {'MB out':>9} {'Time (s)':>9} {'Members/s':>10} {'MB/s':>8}")
+    for stats in sorted(extracted, key=lambda stats: stats['wall_s'], reverse=True):
+        wall_time = stats['wall_s'] or float('nan')
+        name = os.path.basename(stats['archive'])
+        print(f"{name[:40]:<40} {stats['members']:>8} {stats['bytes_in'] / 1e6:>9.2f} {stats['bytes_out'] / 1e6:>9.2f} "
+              f"{stats['wall_s']:>9.3f} {stats['members'] / wall_time:>10.0f} {stats['bytes_out'] / 1e6 / wall_time:>8.1f}")
+    print(f"{'Total':<40} {totals['members']:>8} {totals['bytes_in'] / 1e6:>9.2f} {totals['bytes_out'] / 1e6:>9.2f} "
+          f"{totals['wall_s']:>9.3f} {totals['members_per_s']:>10.0f} {totals['mb_out_per_s']:>8.1f}")
+
+    # Where the time went, summed over all threads
+    print()
+    print(f"Reading and decompressing: {totals['read_s']:.3f} s")
+    print(f"Creating and writing files: {totals['write_s']:.3f} s")
+    print(f"Creating folders: {totals['mkdir_s']:.3f} s")
+    print(f"Checking for unchanged files: {totals['check_s']:.3f} s ({totals['skipped']} skipped)")
+    print(f"Deleting archives: {totals['delete_s']:.3f} s")
+
+def ask_remove():
+    """Ask whether to delete the original zip files, as the interactive version always did."""
+    print("Do you want to delete the original zip files after extraction? (y/n)")
+    delete_original = input("Enter 'y' to delete the original zip files, 'n' to keep them: ").strip().lower()
+    if delete_original not in ['y', 'n']:
+        print("Invalid input. Please enter 'y' or 'n'.")
         sys.exit(1)
+    return delete_original == 'y'
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Extract archives (zip, tar, tar.gz/bz2/xz/zst, 7z), and the archives inside them, to folders '
+                    'with the same name. '
+                    'Without any paths, asks for a folder.')
+    parser.add_argument('paths', nargs='*',
+                        help='archives to extract, or folders to search for archives (including subfolders)')
+    delete = parser.add_mutually_exclusive_group()
+    delete.add_argument('--delete', action='store_true', default=None,
+                        help='delete the archives found in folders or inside other archives once they are extracted')
+    delete.add_argument('--keep', dest='delete', action='store_false',
+                        help='keep all archives (the default when not asked interactively)')
+    parser.add_argument('--dest', help='extract into this folder instead of next to each archive')
+    parser.add_argument('--jobs', type=int, default=WORKERS,
+                        help=f'number of archives extracted at the same time (default: {WORKERS})')
+    parser.add_argument('--member-jobs', type=int, default=MEMBER_WORKERS,
+                        help=f'number of threads sharing the members of large archives, over all archives (default: {MEMBER_WORKERS})')
+    parser.add_argument('--max-depth', type=int, default=MAX_DEPTH,
+                        help=f'how many levels of nested archives to extract (default: {MAX_DEPTH})')
+    parser.add_argument('--full', dest='incremental', action='store_false',
+                        help='write every member, even those already extracted and unchanged')
+    parser.add_argument('--stats', action='store_true',
+                        help='print the size, time and throughput of each archive and where the time went')
+    parser.add_argument('--stats-json', metavar='FILE',
+                        help="save the same statistics as JSON ('-' prints them)")
+    args = parser.parse_args(argv)
+    if args.jobs < 1:
+        parser.error('--jobs must be 1 or more')
+    if args.member_jobs < 1:
+        parser.error('--member-jobs must be 1 or more')
+    if args.max_depth < 0:
+        parser.error('--max-depth must be 0 or more')
+    return args
 
 # ----- Main method -------------------------------------------------------------------------------
-if __name__ == "__main__":
-    if len(sys.argv) > 1:
-        # If a file was provided as argument, extract it
-        extract_zip(sys.argv[1])
-
-        # get into the directory of the unzipped file
-        filepath = (sys.argv[1][:-4])
-        os.chdir(filepath)
-        p = Path(filepath)
-
-        # Get the user's preference for deleting the original zip files
-        print("Do you want to delete the original zip files after extraction? (y/n)")
-        delete_original = input("Enter 'y' to delete the original zip files, 'n' to keep them: ").strip().lower()
-        if delete_original not in ['y', 'n']:
-            print("Invalid input. Please enter 'y' or 'n'.")
-            sys.exit(1)
-
-        remove = delete_original == 'y'
-        if remove:
-            print("Original zip files will be deleted after extraction.")
-
-        # Extract all zip files in the directory and subdirectories
-        for f in p.rglob('*.zip'):
-            extract_zip(f)
-            if remove:
-                os.remove(f)
-                print(f"Deleted original zip file '{f.name}'.")
-
-    else:
-        # Get the current working directory
-        current_dir = os.getcwd()
+def main(argv=None):
+    args = parse_args(argv)
+    interactive = sys.stdin.isatty()
+    paths = args.paths
+
+    if not paths:
+        if not interactive:
+            print("No zip files or directories given.")
+            return 2
 
         # Get the file path from the user
         print("Please enter the path to the directory containing the zip files:")
         print("If the directory is in the same location as this script, you can enter 0.")
-        filepath = input("Enter the path to the directory containing the zip files: ") 
+        filepath = input("Enter the path to the directory containing the zip files: ")
         if filepath == '0':
-            filepath = current_dir
+            filepath = os.getcwd()
 
         if not os.path.exists(filepath):
             print(f"The directory '{filepath}' does not exist.")
-            sys.exit(1)
-
-        p = Path(filepath)
-
-        # Get the user's preference for deleting the original zip files
-        print("Do you want to delete the original zip files after extraction? (y/n)")
-        delete_original = input("Enter 'y' to delete the original zip files, 'n' to keep them: ").strip().lower()
-        if delete_original not in ['y', 'n']:
-            print("Invalid input. Please enter 'y' or 'n'.")
-            sys.exit(1)
-
-        remove = delete_original == 'y'
-        if remove:
-            print("Original zip files will be deleted after extraction.")
-
-        # Extract all zip files in the directory and subdirectories
-        for f in p.rglob('*.zip'):
-            extract_zip(f)
-            if remove:
-                os.remove(f)
-                print(f"Deleted original zip file '{f.name}'.")
\ No newline at end of file
+            return 1
+        paths = [filepath]
+
+    # Only ask about deleting when someone is there to answer (e.g. from the context menu)
+    remove = args.delete
+    if remove is None:
+        remove = ask_remove() if interactive else False
+    if remove:
+        print("Original zip files will be deleted after extraction.")
+
+    # Extract all zip files, the ones in the directories and subdirectories, and the ones inside them
+    start = time.perf_counter()
+    archives, missing = find_archives(paths, args.dest, remove)
+    extracted, failed = extract_recursive(archives, remove, workers=args.jobs, max_depth=args.max_depth,
+                                          member_workers=args.member_jobs, incremental=args.incremental)
+    wall_time = time.perf_counter() - start
+
+    failed = [(path, "does not exist") for path in missing] + failed
+    if args.stats or args.stats_json:
+        totals = summarise_stats(extracted, wall_time)
+        if args.stats:
+            print_stats(extracted, totals)
+        if args.stats_json:
+            report = json.dumps({'totals': totals, 'archives': extracted,
+                                 'failed': [{'archive': str(path), 'error': error} for path, error in failed]}, indent=2)
+            if args.stats_json == '-':
+                print(report)
+            else:
+                with open(args.stats_json, 'w') as f:
+                    f.write(report)
+
+    print()
+    print(f"Extracted {len(extracted)} archive(s), {len(failed)} failed.")
+    for path, error in failed:
+        print(f"- {path}: {error}")
+    return 1 if failed else 0
+
+# ----- Running the programme -------------------
+if __name__ == "__main__":
+    sys.exit(main())